@@ -0,0 +1,17 @@
+"""
+Representative rate expressions used by the benchmarks
+"""
+
+CHANNELS = {
+    # Hodgkin-Huxley sodium and potassium
+    "hh_na_m": ("((v+45)/10)/(1-exp(-(v+45)/10))", "4*exp(-(v+70)/18)"),
+    "hh_na_h": ("0.07*exp(-(v+70)/20)", "1/(exp(-(v+40)/10)+1)"),
+    "hh_k_n": ("0.01*(v+60)/(1-exp(-(v+60)/10))", "0.125*exp(-(v+70)/80)"),
+    # A-type potassium (Connor-Stevens style)
+    "ka_a": ("0.02*(v+43.2)/(1-exp(-(v+43.2)/10))", "0.0175*(v+16.8)/(exp((v+16.8)/10)-1)"),
+    "ka_b": ("0.0016*exp(-(v+83)/18)", "0.05/(1+exp(-(v+49.8)/5))"),
+    # High threshold calcium (Traub style)
+    "cal_s": ("1.6/(1+exp(-0.072*(v-5)))", "0.02*(v+8.9)/(exp((v+8.9)/5)-1)"),
+    # T-type calcium inactivation
+    "cat_h": ("0.00016*exp(-(v+57)/19)", "1/(exp(-(v-15)/10)+1)"),
+}
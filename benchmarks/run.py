@@ -0,0 +1,182 @@
+"""
+Benchmark suite for the neuroneq hot paths
+
+Measures wall time (median of --repeat runs) and peak Python memory
+(tracemalloc) for ab2inf_tau, fit_inf, expression evaluation over growing
+voltage grids, the distance equation over growing populations and the
+parameters page plot path rendered with the Agg backend. Results are
+written as JSON so runs can be compared:
+
+    python benchmarks/run.py -o before.json
+    python benchmarks/run.py -o after.json
+    python benchmarks/run.py --compare before.json after.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Measure the computations themselves, not the persistent result cache
+os.environ["NEURONEQ_CACHE"] = "0"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+
+from channels import CHANNELS
+
+
+def clear_caches():
+    from neuroneq import expressions, utils
+    expressions.clear_cache()
+    utils._simplify_complete.cache_clear()
+
+
+def measure(func, repeat:int) -> dict:
+    """
+    Runs func repeat times from cold caches, returns timing and peak memory
+    """
+    times = []
+    peak = 0
+    for i in range(repeat):
+        clear_caches()
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"median_s": statistics.median(times), "min_s": min(times), "peak_bytes": peak, "repeat": repeat}
+
+
+def benchmarks(quick:bool=False):
+    """
+    Yields (name, callable) pairs
+    """
+    from neuroneq.utils import ab2inf_tau, fit_inf
+    from neuroneq.expressions import compile_expression
+    from neuroneq.distance import DEFAULT_EQUATION, distance_matrix
+
+    for name, (alpha, beta) in CHANNELS.items():
+        inf, tau = ab2inf_tau(alpha, beta, simplify=False)
+        yield "ab2inf_tau/simplify/" + name, lambda a=alpha, b=beta: ab2inf_tau(a, b)
+        yield "ab2inf_tau/raw/" + name, lambda a=alpha, b=beta: ab2inf_tau(a, b, simplify=False)
+        yield "fit_inf/" + name, lambda i=inf: fit_inf(i)
+        yield "fit_inf/fast/" + name, lambda i=inf: fit_inf(i, fast=True)
+
+    alpha, beta = CHANNELS["hh_na_m"]
+    inf, tau = ab2inf_tau(alpha, beta, simplify=False)
+    numexpr = importlib.util.find_spec("numexpr") is not None
+    for points in [10**3, 10**4, 10**5] + ([] if quick else [10**6]):
+        v = np.linspace(-100, 50, points)
+        yield "evaluate/inf/{}".format(points), lambda v=v: compile_expression(inf)(v)
+        if numexpr:
+            yield "evaluate/numexpr/inf/{}".format(points), lambda v=v: with_backend("numexpr", compile_expression(inf), v)
+
+    rng = np.random.default_rng(0)
+    for cells in [100, 300, 1000] + ([] if quick else [3000]):
+        pos = rng.uniform(0, 1000, (cells, 3))
+        vec = pos + rng.normal(0, 1, (cells, 3))
+        yield "distance/{}x{}".format(cells, cells), lambda p=pos, d=vec: distance_matrix(DEFAULT_EQUATION, p, p, d)
+
+    yield "gui/plot", lambda: plot_headless(alpha, beta)
+    if not quick:
+        yield "gui/plot/1000000", lambda: plot_headless(alpha, beta, points=10**6)
+
+
+def with_backend(name:str, func, *args):
+    from neuroneq import expressions
+    previous = expressions.get_backend()
+    expressions.set_backend(name)
+    try:
+        return func(*args)
+    finally:
+        expressions.set_backend(previous)
+
+
+def plot_headless(alpha, beta, points:int=2000):
+    """
+    The Plot Equations path of the parameters page, rendered with Agg
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from neuroneq.plotting import compute_curves, compute_symbolic, draw_rates, draw_inf, draw_tau, draw_regression
+
+    curves = compute_curves(alpha, beta, -100, 50, points=points)
+    for draw in (draw_rates, draw_inf, draw_tau, draw_regression):
+        figure = Figure(figsize=(4,2), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        draw(figure.add_subplot(111), curves)
+        canvas.draw()
+    compute_symbolic(alpha, beta)
+
+
+def metadata() -> dict:
+    import scipy
+    import sympy
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "sympy": sympy.__version__,
+        "matplotlib": matplotlib.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(old_path:str, new_path:str, threshold:float):
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    slower = 0
+    print("{:<40} {:>10} {:>10} {:>8}".format("benchmark", "old ms", "new ms", "ratio"))
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name]["median_s"]/old[name]["median_s"] if old[name]["median_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  slower"
+            slower += 1
+        print("{:<40} {:>10.2f} {:>10.2f} {:>8.2f}{}".format(name, old[name]["median_s"]*1000, new[name]["median_s"]*1000, ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="Results file")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="Skip the largest grid and population sizes")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+
+    results = {}
+    for name, func in benchmarks(args.quick):
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        print("{:<40} {:>10.2f} ms {:>10.1f} KiB".format(name, results[name]["median_s"]*1000, results[name]["peak_bytes"]/1024))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
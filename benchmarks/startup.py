@@ -0,0 +1,73 @@
+"""
+Startup time benchmark
+
+Imports neuroneq the way short headless jobs do, in fresh interpreters,
+and fails if the import is slower than the budget or loads the GUI stack
+(or sympy/scipy) before they are needed.
+
+    python benchmarks/startup.py [--repeat N] [--budget SECONDS]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["tkinter", "matplotlib", "sympy", "scipy"]
+
+CASES = {
+    # statement to time, modules that must not be loaded by it
+    "import neuroneq": ("import neuroneq", HEAVY_MODULES + ["numpy"]),
+    "import neuroneq.cli": ("import neuroneq.cli", HEAVY_MODULES + ["numpy"]),
+    "ab2inf_tau(simplify=False)": (
+        "from neuroneq import ab2inf_tau; ab2inf_tau('exp(v)', 'exp(-v)', simplify=False)", HEAVY_MODULES),
+    "fit_inf(fast=True)": (
+        "from neuroneq import fit_inf; fit_inf('1/(1+exp(-(v+30)/5))', fast=True)", ["tkinter", "matplotlib", "sympy"]),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def run_case(statement, forbidden):
+    env = dict(os.environ, NEURONEQ_CACHE="0", PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.check_output([sys.executable, "-c", PROBE.format(statement=statement, forbidden=forbidden)], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.25, help="Maximum median time for the import-only cases (s)")
+    args = parser.parse_args()
+
+    failed = False
+    results = {}
+    for name, (statement, forbidden) in CASES.items():
+        runs = [run_case(statement, forbidden) for _ in range(args.repeat)]
+        median = statistics.median(run["time"] for run in runs)
+        loaded = sorted(set(module for run in runs for module in run["loaded"]))
+        results[name] = {"median_s": median, "loaded": loaded}
+
+        over_budget = name.startswith("import") and median > args.budget
+        status = "FAIL" if loaded or over_budget else "ok"
+        failed |= status == "FAIL"
+        print("{:<30} {:8.1f} ms  {}{}".format(name, median*1000, status,
+            "  (loaded: " + ", ".join(loaded) + ")" if loaded else ""))
+
+    if failed:
+        sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+TITLE Delayed rectifier potassium channel
+
+COMMENT
+ Gate written directly as inf/tau, with an NMODL power (^) in tau and a
+ rate FUNCTION with a unit annotated parameter.
+ENDCOMMENT
+
+NEURON {
+        SUFFIX kdr
+        USEION k READ ek WRITE ik
+        RANGE gbar, ninf, ntau
+}
+
+UNITS {
+        (mA) = (milliamp)
+        (mV) = (millivolt)
+}
+
+PARAMETER {
+        gbar = 0.003 (mho/cm2)
+        vhalf = -30 (mV)
+        slope = 9 (mV)
+        q10 = 3
+}
+
+STATE { n }
+
+ASSIGNED {
+        v (mV)
+        ek (mV)
+        celsius (degC)
+        ik (mA/cm2)
+        ninf
+        ntau (ms)
+}
+
+BREAKPOINT {
+        SOLVE states METHOD cnexp
+        ik = gbar*n^4*(v - ek)
+}
+
+INITIAL {
+        rates(v)
+        n = ninf
+}
+
+DERIVATIVE states {
+        rates(v)
+        n' = (ninf - n)/ntau
+}
+
+PROCEDURE rates(v(mV)) {
+        LOCAL qt
+        qt = q10^((celsius - 22)/10)
+        ninf = 1/(1 + exp(-(v - vhalf)/slope))
+        ntau = 1/(qt*(bell(v, -40) + 0.05))
+}
+
+FUNCTION bell(v(mV), center(mV)) (/ms) {
+        bell = 0.4*exp(-((v - center)/25)^2)
+}
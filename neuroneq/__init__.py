@@ -1 +1,43 @@
-from .utils import ab2inf_tau, fit_inf
\ No newline at end of file
+"""
+NeuronEQ
+
+The public API is loaded lazily, so importing neuroneq (or the command
+line interface) doesn't pull in numpy, scipy, sympy or the GUI stack
+until they are actually used.
+"""
+
+import importlib
+
+_API = {
+    "ab2inf_tau": "utils",
+    "ab2inf_tau_batch": "utils",
+    "fit_inf": "utils",
+    "fit_tau": "utils",
+    "fit_inf_batch": "fitting",
+    "fit_form": "fitting",
+    "compile_expression": "expressions",
+    "evaluate": "expressions",
+    "distance_matrix": "distance",
+    "iter_edges": "distance",
+    "build_table": "tables",
+    "load_table": "tables",
+    "q10_sweep": "temperature",
+    "simulate": "simulate",
+    "activation": "simulate",
+    "inactivation": "simulate",
+    "render_report": "report",
+}
+
+__all__ = list(_API)
+
+
+def __getattr__(name):
+    if name in _API:
+        value = getattr(importlib.import_module("." + _API[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,131 @@
+"""
+Headless batch conversion of channel definitions
+
+Channels are read one at a time from CSV or JSON Lines with the columns
+name (optional), alpha, beta (or inf, tau), min_v (optional) and max_v
+(optional), and results are streamed back as they finish.
+"""
+
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from . import profiling
+from .utils import ab2inf_tau, fit_inf, fit_tau, inf_tau
+from .workers import profiled
+
+DEFAULT_MIN_V = -100
+DEFAULT_MAX_V = 50
+
+
+def read_channels(stream, format:str=None):
+    """
+    Yields channel dicts from a CSV or JSON Lines stream.
+    The format is detected from the first line when not given.
+    JSON Lines that don't parse are yielded as {"line": n, "error": ...}
+    so one bad line doesn't stop the rest
+    """
+    numbered = ((number, line) for number, line in enumerate(stream, 1) if line.strip())
+    first = next(numbered, None)
+    if first is None:
+        return
+    numbered = itertools.chain([first], numbered)
+
+    if format is None:
+        format = "jsonl" if first[1].lstrip().startswith("{") else "csv"
+
+    if format == "jsonl":
+        for number, line in numbered:
+            try:
+                channel = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"line": number, "error": "Invalid JSON on line {}: {}".format(number, e)}
+                continue
+            if not isinstance(channel, dict):
+                yield {"line": number, "error": "Line {} is not a JSON object".format(number)}
+                continue
+            yield channel
+    elif format == "csv":
+        for row in csv.DictReader(line for number, line in numbered):
+            yield {key.strip(): value.strip() for key, value in row.items() if key and value is not None and value.strip()}
+    else:
+        raise ValueError("Unknown channel format: " + str(format))
+
+
+def convert_channel(channel:dict, simplify:bool=True, fast:bool=False, tau_fit:bool=False) -> dict:
+    """
+    Converts a single channel definition to inf/tau expressions and
+    a fitted x_inf (and with tau_fit, the best standard tau form).
+    Channels given as inf/tau instead of alpha/beta are fit directly.
+    Errors are reported in the result instead of raised
+    """
+    result = {key: channel[key] for key in ("index", "name", "line") if key in channel}
+    if "error" in channel:
+        result["error"] = channel["error"]
+        return result
+    try:
+        min_v = float(channel.get("min_v", DEFAULT_MIN_V))
+        max_v = float(channel.get("max_v", DEFAULT_MAX_V))
+
+        if "alpha" in channel or "beta" in channel:
+            alpha = str(channel["alpha"])
+            beta = str(channel["beta"])
+            inf, tau = ab2inf_tau(alpha, beta, simplify=simplify)
+            raw_inf, raw_tau = ab2inf_tau(alpha, beta, simplify=False)
+        else:
+            raw_inf, raw_tau = inf_tau(str(channel["inf"]), str(channel.get("tau", "")), simplify=False)
+            inf, tau = inf_tau(raw_inf, raw_tau, simplify=simplify)
+        fit, popt, resid = fit_inf(raw_inf, min_v, max_v, fast=fast, full_output=True)
+
+        result.update({
+            "inf": inf,
+            "tau": tau,
+            "fit_inf": fit,
+            "fit_vh": float(popt[0]),
+            "fit_tau": float(popt[1]),
+            "resid": float(resid),
+        })
+        if tau_fit and raw_tau:
+            best = fit_tau(raw_tau, min_v, max_v)
+            result.update({
+                "tau_fit_form": best["form"],
+                "tau_fit_expression": best["expression"],
+                "tau_fit_resid": best["resid"],
+            })
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def convert_stream(channels, jobs:int=1, simplify:bool=True, fast:bool=False, tau_fit:bool=False):
+    """
+    Yields convert_channel results as they finish. Each channel is tagged
+    with its input position as "index". At most a few channels per worker
+    are in flight at once, so memory stays bounded for any input size
+    """
+    channels = ({**channel, "index": index} for index, channel in enumerate(channels))
+    if jobs == 1:
+        for channel in channels:
+            yield convert_channel(channel, simplify, fast, tau_fit)
+        return
+
+    jobs = jobs or os.cpu_count() or 1
+    window = 4*jobs
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+        for channel in channels:
+            pending.add(executor.submit(profiled, convert_channel, channel, simplify, fast, tau_fit))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _merged(future)
+        for future in as_completed(pending):
+            yield _merged(future)
+
+
+def _merged(future) -> dict:
+    result, stats = future.result()
+    profiling.merge(stats)
+    return result
@@ -0,0 +1,143 @@
+"""
+Persistent result cache
+
+Simplified equations and fit results are stored in a SQLite database in
+the user cache directory, so GUI sessions, library calls and batch workers
+share them across processes and runs. Keys are a hash of the normalized
+expression plus the options that affect the result; the least recently
+used entries are evicted past MAX_ENTRIES, and CACHE_VERSION is part of
+every key so results from an older algorithm are never reused. The database runs in WAL mode
+with a busy timeout so concurrent writers wait instead of failing, and any
+database error is treated as a miss so the cache can never break a
+computation.
+
+NEURONEQ_CACHE=0 disables the cache, NEURONEQ_CACHE_DIR moves it.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .profiling import timed
+
+MAX_ENTRIES = 20000
+DB_FILE = "results.sqlite"
+TIMEOUT = 30.0
+# Bump when a cached computation changes its results
+CACHE_VERSION = 2
+
+_local = threading.local()
+
+
+def cache_dir() -> str:
+    """
+    NEURONEQ_CACHE_DIR, or neuroneq in the platform's user cache directory
+    """
+    path = os.environ.get("NEURONEQ_CACHE_DIR")
+    if path:
+        return path
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "neuroneq")
+
+
+def enabled() -> bool:
+    return os.environ.get("NEURONEQ_CACHE", "1").lower() not in ("0", "false", "no", "off")
+
+
+def make_key(kind:str, *parts) -> str:
+    """
+    Content hash of kind and parts (anything JSON serializable),
+    salted with CACHE_VERSION
+    """
+    text = json.dumps([CACHE_VERSION, kind] + list(parts), sort_keys=True, default=str)
+    return kind + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    """
+    One connection per thread and process, created on first use
+    """
+    path = os.path.join(cache_dir(), DB_FILE)
+    connection = getattr(_local, "connection", None)
+    if connection is not None and _local.pid == os.getpid() and _local.path == path:
+        return connection
+
+    import sqlite3
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=TIMEOUT, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+    _local.connection, _local.pid, _local.path = connection, os.getpid(), path
+    return connection
+
+
+def get(key:str):
+    """
+    Cached value for key, or None
+    """
+    if not enabled():
+        return None
+    try:
+        with timed("cache.get"):
+            connection = _connect()
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+    except Exception:
+        return None
+
+
+def put(key:str, value, max_entries:int=MAX_ENTRIES):
+    """
+    Stores a JSON serializable value and evicts the least recently used
+    entries past max_entries
+    """
+    if not enabled():
+        return
+    try:
+        with timed("cache.put"):
+            connection = _connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("INSERT OR REPLACE INTO results (key, value, accessed) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time()))
+                count = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                if count > max_entries:
+                    connection.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                        (count - max_entries,))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+    except Exception:
+        pass
+
+
+def cached(key:str, compute):
+    """
+    Returns the cached value for key, computing and storing it on a miss
+    """
+    value = get(key)
+    if value is None:
+        value = compute()
+        put(key, value)
+    return value
+
+
+def clear():
+    """
+    Removes every entry
+    """
+    try:
+        _connect().execute("DELETE FROM results")
+    except Exception:
+        pass
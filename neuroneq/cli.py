@@ -1,8 +1,8 @@
 import click
+import json
 import logging
 import os
-
-from .main import NeuronEQWindow
+import sys
 
 class DefaultCommandGroup(click.Group):
     """allow a default command for a group"""
@@ -37,8 +37,28 @@ class DefaultCommandGroup(click.Group):
 
 @click.group(cls=DefaultCommandGroup, invoke_without_command=True)
 @click.option('--verbose', is_flag=True, default=False, help='Verbose printing')
+@click.option('--profile', type=click.File('w'), default=None, help='Write per-stage timings as JSON to this file (- for stderr) on exit')
+@click.option('--backend', type=click.Choice(['numpy', 'numexpr']), default=None, help='Expression evaluation backend, numexpr evaluates large grids on all cores')
+@click.option('--simplify-timeout', type=float, default=None, help='Seconds allowed for simplifying each equation, the best form found by then is used')
 @click.pass_context
-def cli(ctx, verbose):
+def cli(ctx, verbose, profile, backend, simplify_timeout):
+    if simplify_timeout is not None:
+        # Read by worker processes too
+        os.environ["NEURONEQ_SIMPLIFY_TIMEOUT"] = str(simplify_timeout)
+    if backend is not None:
+        # Worker processes read the backend from the environment
+        os.environ["NEURONEQ_BACKEND"] = backend
+        from .expressions import set_backend
+        set_backend(backend)
+
+    if profile is not None:
+        if profile.name == '<stdout>':
+            profile = sys.stderr
+        def dump_profile():
+            from . import profiling
+            profiling.dump(profile)
+        ctx.call_on_close(dump_profile)
+
     if not ctx.invoked_subcommand:
         gui()
 
@@ -47,6 +67,7 @@ def cli(ctx, verbose):
 
     ctx_obj = {}
     ctx_obj["verbose"] = verbose
+    ctx_obj["profile"] = profile is not None
 
     ctx.obj = ctx_obj
 
@@ -54,8 +75,71 @@ def cli(ctx, verbose):
 @cli.command('gui',help="Display Default GUI Window",default_command=True)
 @click.pass_context
 def gui(ctx):
+    from .main import NeuronEQWindow
     neq = NeuronEQWindow()
     neq.display()
 
+@cli.command('convert',help="Convert alpha/beta channel definitions (CSV or JSON Lines) to inf/tau without a display")
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='JSON Lines output file (default stdout)')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'jsonl']), default=None, help='Input format, detected from the first line by default')
+@click.option('--jobs', '-j', type=int, default=1, help='Number of worker processes, 0 for one per core')
+@click.option('--no-simplify', is_flag=True, default=False, help='Skip sympy simplification of inf/tau')
+@click.option('--fast', is_flag=True, default=False, help='Use the closed-form x_inf fit')
+@click.option('--fit-tau', is_flag=True, default=False, help='Also fit x_tau to the best standard form')
+@click.pass_context
+def convert(ctx, input, output, input_format, jobs, no_simplify, fast, fit_tau):
+    from .batch import convert_stream, read_channels
+
+    channels = read_channels(input, format=input_format)
+    for result in convert_stream(channels, jobs=jobs or None, simplify=not no_simplify, fast=fast, tau_fit=fit_tau):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+
+@cli.command('scan',help="Convert the rates of every NMODL .mod file in a directory, reusing results for unchanged files")
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--output', '-o', type=click.File('w'), default='-', help='JSON Lines output file (default stdout)')
+@click.option('--index', 'index_path', type=click.Path(dir_okay=False), default=None, help='Index file (default DIRECTORY/.neuroneq_index.json)')
+@click.option('--jobs', '-j', type=int, default=0, help='Number of worker processes, 0 for one per core')
+@click.option('--celsius', type=float, default=6.3, help='Temperature used when a file does not set celsius')
+@click.option('--no-simplify', is_flag=True, default=False, help='Skip sympy simplification of inf/tau')
+@click.option('--fast', is_flag=True, default=False, help='Use the closed-form x_inf fit')
+@click.pass_context
+def scan(ctx, directory, output, index_path, jobs, celsius, no_simplify, fast):
+    from .nmodl import scan_directory
+
+    results = scan_directory(directory, index_path=index_path, jobs=jobs or None,
+        simplify=not no_simplify, fast=fast, celsius=celsius)
+    for path, gates in results.items():
+        for gate in gates:
+            output.write(json.dumps({"file": path, **gate}) + "\n")
+
+@cli.command('report',help="Render the parameters page figure for every channel in a list (CSV or JSON Lines) to a directory, skipping unchanged channels")
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('--output', '-o', 'directory', type=click.Path(file_okay=False), default='report', help='Output directory (default ./report)')
+@click.option('--format', 'formats', type=click.Choice(['png', 'pdf']), multiple=True, default=['png'], help='Figure format, repeat for several')
+@click.option('--input-format', type=click.Choice(['csv', 'jsonl']), default=None, help='Input format, detected from the first line by default')
+@click.option('--jobs', '-j', type=int, default=0, help='Number of worker processes, 0 for one per core')
+@click.option('--no-simplify', is_flag=True, default=False, help='Skip sympy simplification of inf/tau')
+@click.pass_context
+def report(ctx, input, directory, formats, input_format, jobs, no_simplify):
+    from .batch import read_channels
+    from .report import INDEX_PAGE, render_report
+
+    results = render_report(read_channels(input, input_format), directory, jobs=jobs or None,
+        formats=formats, simplify=not no_simplify)
+    errors = [result for result in results if "error" in result]
+    cached = sum(1 for result in results if result.get("cached"))
+    for result in errors:
+        click.echo(result["name"] + ": " + result["error"], err=True)
+    click.echo("{} channels ({} unchanged, {} errors): {}".format(len(results), cached, len(errors),
+        os.path.join(directory, INDEX_PAGE)), err=True)
+
+@cli.command('clear-cache',help="Remove all entries from the persistent result cache")
+def clear_cache():
+    from . import cache
+    cache.clear()
+    click.echo("Cleared " + os.path.join(cache.cache_dir(), cache.DB_FILE))
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
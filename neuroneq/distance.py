@@ -0,0 +1,198 @@
+"""
+Population-scale distance equations
+
+Evaluates the distance equation from the distance equation visualizer
+(written for a single src_pos/trg_pos/vec_pos triple) over whole
+populations. Positions get a trailing xyz axis and np.linalg.norm, np.dot
+etc. reduce over that axis, so the same equation broadcasts over pairs.
+"""
+
+import re
+
+import numpy as np
+
+from .expressions import NAMESPACE, evaluate
+
+DEFAULT_EQUATION = "np.linalg.norm(np.cross((trg_pos - src_pos), (trg_pos - vec_pos))) / np.linalg.norm((vec_pos - src_pos))"
+EUCLIDEAN_EQUATION = "np.linalg.norm(trg_pos - src_pos)"
+
+# Bytes of position temporaries allowed per chunk
+MAX_CHUNK_MEMORY = 64*1024*1024
+
+
+class _VectorLinalg():
+    def __getattr__(self, name):
+        return getattr(np.linalg, name)
+
+    @staticmethod
+    def norm(x, ord=None, axis=-1, keepdims=False):
+        return np.linalg.norm(x, ord=ord, axis=axis, keepdims=keepdims)
+
+
+class _VectorNumpy():
+    """
+    numpy, with vector reductions taken over the last (xyz) axis
+    """
+    linalg = _VectorLinalg()
+
+    def __getattr__(self, name):
+        return getattr(np, name)
+
+    @staticmethod
+    def dot(a, b):
+        return np.sum(np.asarray(a)*np.asarray(b), axis=-1)
+
+
+VECTOR_NAMESPACE = dict(NAMESPACE, np=_VectorNumpy())
+
+
+def _positions(pos, name:str):
+    pos = np.asarray(pos, dtype=float)
+    if pos.ndim == 1:
+        pos = pos[None, :]
+    if pos.ndim != 2 or pos.shape[1] != 3:
+        raise ValueError("{} must have shape (N, 3), got {}".format(name, pos.shape))
+    return pos
+
+
+def _check_vec_pos(equation:str, vec_pos):
+    """
+    vec_pos may only be left out when the equation doesn't use it, there
+    is no meaningful default direction (DEFAULT_EQUATION would be all NaN)
+    """
+    if vec_pos is None and re.search(r"\bvec_pos\b", equation):
+        raise ValueError("The distance equation uses vec_pos, but no vec_pos was given")
+
+
+def evaluate_distance(equation:str, src_pos, trg_pos, vec_pos=None):
+    """
+    Evaluates the distance equation on broadcastable (..., 3) position
+    arrays and returns an array of the broadcast shape without the xyz axis.
+    vec_pos is required when the equation uses it
+    """
+    _check_vec_pos(equation, vec_pos)
+    src_pos = np.asarray(src_pos, dtype=float)
+    trg_pos = np.asarray(trg_pos, dtype=float)
+    vec_pos = src_pos if vec_pos is None else np.asarray(vec_pos, dtype=float)
+    shape = np.broadcast_shapes(src_pos.shape, trg_pos.shape, vec_pos.shape)[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dist = evaluate(equation, VECTOR_NAMESPACE, src_pos=src_pos, trg_pos=trg_pos, vec_pos=vec_pos)
+    return np.broadcast_to(dist, shape)
+
+
+def _chunk_rows(n_trg:int, chunk_size:int=None) -> int:
+    if chunk_size:
+        return chunk_size
+    # A handful of (rows, n_trg, 3) temporaries live at once while evaluating
+    return max(1, MAX_CHUNK_MEMORY // (8*3*8*max(n_trg, 1)))
+
+
+def iter_distance_chunks(equation:str, src_pos, trg_pos, vec_pos=None, chunk_size:int=None):
+    """
+    Yields (start, stop, distances) for consecutive blocks of sources,
+    where distances has shape (stop-start, M)
+    """
+    _check_vec_pos(equation, vec_pos)
+    src_pos = _positions(src_pos, "src_pos")
+    trg_pos = _positions(trg_pos, "trg_pos")
+    if vec_pos is not None:
+        vec_pos = np.broadcast_to(_positions(vec_pos, "vec_pos"), src_pos.shape)
+
+    rows = _chunk_rows(trg_pos.shape[0], chunk_size)
+    for start in range(0, src_pos.shape[0], rows):
+        stop = min(start + rows, src_pos.shape[0])
+        src = src_pos[start:stop, None, :]
+        vec = None if vec_pos is None else vec_pos[start:stop, None, :]
+        yield start, stop, evaluate_distance(equation, src, trg_pos[None, :, :], vec)
+
+
+def distance_matrix(equation:str, src_pos, trg_pos, vec_pos=None, chunk_size:int=None, sparse:bool=False, cutoff:float=None):
+    """
+    Evaluates the distance equation for every (source, target) pair.
+    src_pos is (N, 3), trg_pos (M, 3) and vec_pos is (N, 3), one direction
+    point per source, or a single (3,) point (required when the equation
+    uses vec_pos, as DEFAULT_EQUATION does). Returns a dense (N, M) array,
+    or with sparse=True a scipy.sparse CSR matrix holding the finite
+    distances that are <= cutoff (all finite ones if cutoff is None)
+    """
+    src_pos = _positions(src_pos, "src_pos")
+    trg_pos = _positions(trg_pos, "trg_pos")
+    shape = (src_pos.shape[0], trg_pos.shape[0])
+    chunks = iter_distance_chunks(equation, src_pos, trg_pos, vec_pos, chunk_size)
+
+    if not sparse:
+        out = np.empty(shape)
+        for start, stop, dist in chunks:
+            out[start:stop] = dist
+        return out
+
+    from scipy.sparse import csr_matrix
+
+    rows, cols, data = [], [], []
+    for start, stop, dist in chunks:
+        keep = np.isfinite(dist)
+        if cutoff is not None:
+            keep &= dist <= cutoff
+        r, c = np.nonzero(keep)
+        rows.append(r + start)
+        cols.append(c)
+        data.append(dist[r, c])
+    if not data:
+        return csr_matrix(shape)
+    return csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+
+
+EDGE_DTYPE = np.dtype([("src", np.int64), ("trg", np.int64), ("distance", np.float64)])
+
+
+def iter_edges(equation:str, src_pos, trg_pos, cutoff:float, vec_pos=None, max_distance:float=None, chunk_size:int=4096):
+    """
+    Yields structured arrays (EDGE_DTYPE) of (src, trg, distance) edges.
+    A KD-tree over the targets limits the distance equation to the pairs
+    whose euclidean distance is <= cutoff. Edges with a non-finite distance,
+    or one above max_distance when given, are dropped
+    """
+    from scipy.spatial import cKDTree
+
+    _check_vec_pos(equation, vec_pos)
+    src_pos = _positions(src_pos, "src_pos")
+    trg_pos = _positions(trg_pos, "trg_pos")
+    if vec_pos is not None:
+        vec_pos = np.broadcast_to(_positions(vec_pos, "vec_pos"), src_pos.shape)
+    tree = cKDTree(trg_pos)
+
+    for start in range(0, src_pos.shape[0], chunk_size):
+        stop = min(start + chunk_size, src_pos.shape[0])
+        neighbours = tree.query_ball_point(src_pos[start:stop], r=cutoff)
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.intp, count=len(neighbours))
+        if not counts.sum():
+            continue
+        src = np.repeat(np.arange(start, stop), counts)
+        trg = np.concatenate([np.asarray(n, dtype=np.intp) for n in neighbours if n])
+
+        vec = None if vec_pos is None else vec_pos[src]
+        dist = evaluate_distance(equation, src_pos[src], trg_pos[trg], vec)
+        keep = np.isfinite(dist)
+        if max_distance is not None:
+            keep &= dist <= max_distance
+
+        edges = np.empty(int(keep.sum()), dtype=EDGE_DTYPE)
+        edges["src"] = src[keep]
+        edges["trg"] = trg[keep]
+        edges["distance"] = dist[keep]
+        yield edges
+
+
+def write_edges(path:str, equation:str, src_pos, trg_pos, cutoff:float, vec_pos=None, max_distance:float=None, chunk_size:int=4096):
+    """
+    Writes the edges from iter_edges to path chunk by chunk as raw
+    EDGE_DTYPE records and returns them memory-mapped
+    """
+    count = 0
+    with open(path, "wb") as f:
+        for edges in iter_edges(equation, src_pos, trg_pos, cutoff, vec_pos, max_distance, chunk_size):
+            edges.tofile(f)
+            count += edges.shape[0]
+    if not count:
+        return np.empty(0, dtype=EDGE_DTYPE)
+    return np.memmap(path, dtype=EDGE_DTYPE, mode="r", shape=(count,))
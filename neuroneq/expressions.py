@@ -0,0 +1,218 @@
+"""
+Compiled expression engine
+
+Equations entered by the user (alpha, beta, inf, tau, distance equations)
+are compiled once into Python code objects and evaluated against a NumPy
+namespace, so exp(), cos(), pi, etc. resolve to their vectorized versions
+without rewriting the string. Compiled expressions are kept in a bounded
+LRU cache keyed by the normalized expression.
+
+With the optional numexpr backend (set_backend("numexpr") or the
+NEURONEQ_BACKEND environment variable) large grids are evaluated by numexpr
+instead, blockwise on all cores without a temporary array per
+sub-expression. Small inputs, expressions numexpr can't handle and
+installs without numexpr keep using NumPy.
+"""
+
+import io
+import os
+import re
+import tokenize
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+from .profiling import timed
+
+CACHE_SIZE = 512
+
+BACKENDS = ("numpy", "numexpr")
+# Below this many points NumPy is faster than starting numexpr's threads
+NUMEXPR_MIN_SIZE = 1 << 16
+
+NAMESPACE = {
+    "np": np,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+    "cos": np.cos,
+    "sin": np.sin,
+    "tan": np.tan,
+    "cosh": np.cosh,
+    "sinh": np.sinh,
+    "tanh": np.tanh,
+    "abs": np.abs,
+    "fabs": np.abs,
+    "pow": np.power,
+    "pi": np.pi,
+}
+
+
+_backend = os.environ.get("NEURONEQ_BACKEND", "numpy")
+_numexpr = None
+_numexpr_unsupported = set()
+
+
+def set_backend(name:str) -> str:
+    """
+    Selects the evaluation backend, "numpy" (default) or "numexpr".
+    Returns the backend actually in use, numpy if numexpr isn't installed
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend: " + str(name) + ", expected one of " + ", ".join(BACKENDS))
+    _backend = name
+    if name == "numexpr" and _load_numexpr() is None:
+        _backend = "numpy"
+    return _backend
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def _load_numexpr():
+    global _numexpr, _backend
+    if _numexpr is None:
+        try:
+            import numexpr
+        except ImportError:
+            warnings.warn("numexpr is not installed, falling back to the numpy backend", RuntimeWarning)
+            _backend = "numpy"
+            return None
+        _numexpr = numexpr
+    return _numexpr
+
+
+def _numexpr_source(expression:str) -> str:
+    """
+    Rewrites a normalized expression for numexpr, which has no np. prefix
+    and spells fabs as abs
+    """
+    return re.sub(r"\bfabs\(", "abs(", re.sub(r"\bnp\.", "", expression))
+
+
+def _evaluate_numexpr(expression:str, variables:dict):
+    """
+    Evaluates with numexpr when the backend is on and the input is large
+    enough, otherwise (or if numexpr rejects the expression) returns None
+    """
+    if _backend != "numexpr":
+        return None
+    size = max((np.size(value) for value in variables.values()), default=0)
+    if size < NUMEXPR_MIN_SIZE:
+        return None
+    source = _numexpr_source(normalize(expression))
+    if source in _numexpr_unsupported:
+        return None
+    numexpr = _load_numexpr()
+    if numexpr is None:
+        return None
+
+    local_dict = {"pi": np.pi}
+    local_dict.update((name, np.asarray(value, dtype=float)) for name, value in variables.items())
+    try:
+        with timed("expression.numexpr"):
+            return numexpr.evaluate(source, local_dict=local_dict, global_dict={})
+    except (KeyError, NotImplementedError, SyntaxError, TypeError, ValueError):
+        # eg pow() or other NumPy only functions
+        _numexpr_unsupported.add(source)
+        return None
+
+
+def normalize(expression:str) -> str:
+    """
+    Returns the canonical form of an expression, used as the cache key.
+    Whitespace is removed except where two names or numbers meet (eg
+    "1 if v > 0 else 0"), and NMODL/sympy style '^' powers become '**'
+    """
+    text = str(expression)
+    try:
+        tokens = [token for token in tokenize.generate_tokens(io.StringIO(text).readline)
+            if token.type in (tokenize.NAME, tokenize.NUMBER, tokenize.OP, tokenize.STRING)]
+    except (tokenize.TokenError, SyntaxError):
+        # Left for compile() to report
+        return "".join(text.split()).replace("^", "**")
+
+    parts = []
+    previous = None
+    for token in tokens:
+        if previous in (tokenize.NAME, tokenize.NUMBER) and token.type in (tokenize.NAME, tokenize.NUMBER):
+            parts.append(" ")
+        parts.append("**" if token.string == "^" else token.string)
+        previous = token.type
+    return "".join(parts)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_normalized(expression:str):
+    with timed("expression.parse"):
+        return compile(expression, "<neuroneq>", "eval")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(expression:str):
+    return _compile_normalized(normalize(expression))
+
+
+def evaluate(expression:str, namespace:dict=None, **variables):
+    """
+    Evaluates an expression with the given variables, eg evaluate("exp(v)", v=v)
+    """
+    code = _compile(expression)
+    if namespace is None:
+        result = _evaluate_numexpr(expression, variables)
+        if result is not None:
+            return result
+    with timed("expression.eval"):
+        return eval(code, namespace if namespace is not None else NAMESPACE, variables)
+
+
+def compile_expression(expression:str, variables:tuple=("v",)):
+    """
+    Returns a vectorized callable of the given variables (default v).
+    Constant expressions are broadcast to the shape of the first argument.
+    """
+    code = _compile(expression)
+
+    def func(*args):
+        values = dict(zip(variables, args))
+        result = _evaluate_numexpr(expression, values)
+        if result is None:
+            with timed("expression.eval"):
+                result = eval(code, NAMESPACE, values)
+        if args:
+            result = np.asarray(result, dtype=float)
+            shape = np.shape(args[0])
+            if result.shape != shape:
+                result = np.broadcast_to(result, shape).copy()
+        return result
+
+    func.expression = expression
+    func.variables = variables
+    return func
+
+
+def clear_cache():
+    """
+    Drops all compiled expressions
+    """
+    _compile.cache_clear()
+    _compile_normalized.cache_clear()
+    _numexpr_unsupported.clear()
+
+
+def inf_expression(alpha:str, beta:str) -> str:
+    """
+    Builds the x_inf expression alpha/(alpha+beta)
+    """
+    return alpha + "/( " + alpha + " + " + beta + ")"
+
+
+def tau_expression(alpha:str, beta:str) -> str:
+    """
+    Builds the x_tau expression 1/(alpha+beta)
+    """
+    return "1/( " + alpha + " + " + beta + ")"
@@ -0,0 +1,389 @@
+"""
+Curve fitting for gating functions
+"""
+
+from functools import lru_cache
+import warnings
+
+import numpy as np
+
+from .profiling import timed
+
+VH_BOUNDS = (-1000.0, 1000.0)
+TAU_BOUNDS = (0.00001, 1000.0)
+
+
+def inf_func(v, vh, tau):
+    """
+    Standard Boltzmann form 1.0/(1.0+(exp((v+vh)/(tau))))
+    """
+    return 1.0/(1.0+(np.exp((v+vh)/(tau))))
+
+
+def inf_jac(v, vh, tau):
+    """
+    Analytic Jacobian of inf_func with respect to (vh, tau), shape (len(v), 2)
+    """
+    f = inf_func(v, vh, tau)
+    df = f*(1.0-f)
+    return np.column_stack((-df/tau, df*(v+vh)/(tau*tau)))
+
+
+@lru_cache(maxsize=128)
+def compile_form(form:str, params:tuple, variable:str="v") -> tuple:
+    """
+    Compiles a user supplied fit form such as "a*exp(-(v-vh)/k)" with the
+    given parameter names into NumPy callables (func, jac) suitable for
+    curve_fit(func, v, y, jac=jac). The derivatives are taken symbolically
+    """
+    import sympy
+
+    x = sympy.Symbol(variable)
+    symbols = sympy.symbols(params)
+    expression = sympy.sympify(form, locals={name: symbol for name, symbol in zip(params, symbols)})
+    derivatives = [sympy.diff(expression, symbol) for symbol in symbols]
+
+    f = sympy.lambdify((x,) + tuple(symbols), expression, "numpy")
+    dfs = [sympy.lambdify((x,) + tuple(symbols), d, "numpy") for d in derivatives]
+
+    def func(v, *p):
+        return np.broadcast_to(f(v, *p), np.shape(v)).astype(float)
+
+    def jac(v, *p):
+        return np.column_stack([np.broadcast_to(df(v, *p), np.shape(v)) for df in dfs]).astype(float)
+
+    return func, jac
+
+
+def fit_form(form:str, params, v, y, p0=None, bounds=(-np.inf, np.inf), variable:str="v") -> tuple:
+    """
+    Fits y(v) to an arbitrary form using its symbolic Jacobian.
+    Returns (popt, resid)
+    """
+    from scipy.optimize import curve_fit
+
+    func, jac = compile_form(form, tuple(params), variable)
+    with timed("curve_fit"):
+        popt, pcov = curve_fit(func, v, y, p0=p0, jac=jac, bounds=bounds)
+    return popt, np.linalg.norm(y-func(v, *popt))
+
+
+def interval_widths(v):
+    """
+    Width of the voltage interval each sample stands for, constant on a
+    uniform grid
+    """
+    return np.gradient(np.asarray(v, dtype=float)) if len(v) > 1 else np.ones(len(v))
+
+
+def _weighted_resid(v, y, popt, widths):
+    """
+    Residual norm with every point weighted by its interval width, scaled
+    to match the plain norm on a uniform grid of the same size
+    """
+    r = y-inf_func(v, *popt)
+    return np.sqrt(len(v)*np.sum(widths*r*r)/np.sum(widths))
+
+
+def fit_inf_popt(v, y, fast:bool=False, fast_tol:float=1e-3) -> tuple:
+    """
+    Fits y(v) to inf_func, returns (popt, resid).
+    By default both slope signs are fit and the best is kept. With fast=True
+    (vh, tau) are estimated in one pass by linear least squares on logit(y),
+    followed by a single nonlinear refinement seeded from that estimate only
+    if the RMS residual is larger than fast_tol.
+    Residuals are weighted by interval_widths, so adaptive grids that
+    cluster points on the steep part fit like a uniform grid would
+    """
+    v = np.asarray(v, dtype=float)
+    y = np.asarray(y, dtype=float)
+    widths = interval_widths(v)
+    sigma = 1.0/np.sqrt(widths)
+
+    if fast:
+        with timed("logit_estimate"):
+            vh, tau = logit_estimate(v, y, weights=widths)
+        popt = np.array([vh[0], tau[0]])
+        resid = _weighted_resid(v, y, popt, widths)
+        if resid/np.sqrt(len(v)) <= fast_tol:
+            return popt, resid
+
+    from scipy.optimize import curve_fit
+
+    if fast:
+        if popt[1] > 0:
+            bounds = ((-1000,0.00001),(1000,1000))
+        else:
+            bounds = ((-1000,-1000),(1000,-0.00001))
+        with timed("curve_fit"):
+            popt, pcov = curve_fit(inf_func, v, y, p0=popt, sigma=sigma, jac=inf_jac, bounds=bounds)
+        return popt, _weighted_resid(v, y, popt, widths)
+
+    with timed("curve_fit"):
+        popt_n, pcov_n = curve_fit(inf_func, v, y, sigma=sigma, jac=inf_jac, bounds=((-1000,-1000),(1000,-0.00001)))
+    with timed("curve_fit"):
+        popt_p, pcov_p = curve_fit(inf_func, v, y, sigma=sigma, jac=inf_jac, bounds=((-1000,0.00001),(1000,1000)))
+
+    resid_n = _weighted_resid(v, y, popt_n, widths)
+    resid_p = _weighted_resid(v, y, popt_p, widths)
+
+    if resid_n <= resid_p:
+        return popt_n, resid_n
+    else:
+        return popt_p, resid_p
+
+
+def _clip_params(vh, tau):
+    vh = np.clip(vh, *VH_BOUNDS)
+    sign = np.where(tau < 0, -1.0, 1.0)
+    tau = sign*np.clip(np.abs(tau), *TAU_BOUNDS)
+    return vh, tau
+
+
+def logit_estimate(v, Y, low=0.01, high=0.99, weights=None):
+    """
+    Estimates (vh, tau) for every row of Y by weighted linear least squares
+    on logit(y) = -(v+vh)/tau over the points where low < y < high.
+    weights (eg interval_widths) scale each point's weight.
+    Rows without enough usable points fall back to the half activation
+    crossing and a slope of a tenth of the voltage range
+    """
+    v = np.asarray(v, dtype=float)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+
+    mask = np.isfinite(Y) & (Y > low) & (Y < high)
+    Yc = np.where(mask, Y, 0.5)
+    z = np.log(1.0/Yc - 1.0)
+    w = np.where(mask, Yc*(1.0-Yc), 0.0)**2
+    if weights is not None:
+        w = w*weights
+
+    sw = w.sum(axis=1)
+    swv = (w*v).sum(axis=1)
+    swz = (w*z).sum(axis=1)
+    swvv = (w*v*v).sum(axis=1)
+    swvz = (w*v*z).sum(axis=1)
+    det = sw*swvv - swv*swv
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (sw*swvz - swv*swz)/det
+        intercept = (swz - slope*swv)/sw
+        tau = 1.0/slope
+        vh = intercept*tau
+
+    # Fallback for flat or nearly saturated curves
+    finite = np.where(np.isfinite(Y), Y, 0.5)
+    crossing = v[np.argmin(np.abs(finite-0.5), axis=1)]
+    direction = np.where(finite[:,0] >= finite[:,-1], 1.0, -1.0)
+    span = (v.max() - v.min())/10.0 or 1.0
+    bad = (mask.sum(axis=1) < 2) | ~np.isfinite(vh) | ~np.isfinite(tau) | (det <= 0)
+    vh = np.where(bad, -crossing, vh)
+    tau = np.where(bad, direction*span, tau)
+
+    return _clip_params(vh, tau)
+
+
+def _fit_inf_chunk(v, Y, max_iter, tol):
+    mask = np.isfinite(Y)
+    Y = np.where(mask, Y, 0.0)
+    vh, tau = logit_estimate(v, Y)
+    lam = np.full(vh.shape, 1e-3)
+
+    r = np.where(mask, Y - inf_func(v, vh[:,None], tau[:,None]), 0.0)
+    cost = (r*r).sum(axis=1)
+    active = np.arange(vh.shape[0])
+    converged = np.zeros(vh.shape[0], dtype=bool)
+
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        # Only the curves that haven't converged take part in the iteration
+        m, y = mask[active], Y[active]
+        a_vh, a_tau, a_lam, a_cost = vh[active], tau[active], lam[active], cost[active]
+
+        f = inf_func(v, a_vh[:,None], a_tau[:,None])
+        r = np.where(m, y - f, 0.0)
+        df = np.where(m, f*(1.0-f), 0.0)
+        j_vh = -df/a_tau[:,None]
+        j_tau = df*(v+a_vh[:,None])/(a_tau[:,None]**2)
+
+        a = (j_vh*j_vh).sum(axis=1)
+        b = (j_vh*j_tau).sum(axis=1)
+        c = (j_tau*j_tau).sum(axis=1)
+        g_vh = (j_vh*r).sum(axis=1)
+        g_tau = (j_tau*r).sum(axis=1)
+
+        # Levenberg-Marquardt step, 2x2 normal equations solved in closed form
+        a_d = a*(1.0+a_lam)
+        c_d = c*(1.0+a_lam)
+        det = a_d*c_d - b*b
+        d_vh = (c_d*g_vh - b*g_tau)/det
+        d_tau = (a_d*g_tau - b*g_vh)/det
+        ok = np.isfinite(d_vh) & np.isfinite(d_tau)
+        d_vh = np.where(ok, d_vh, 0.0)
+        d_tau = np.where(ok, d_tau, 0.0)
+
+        # Don't let a step flip the sign of the slope
+        new_tau = a_tau + d_tau
+        new_vh, new_tau = _clip_params(a_vh + d_vh, np.where(new_tau*a_tau > 0, new_tau, a_tau/2.0))
+        new_r = np.where(m, y - inf_func(v, new_vh[:,None], new_tau[:,None]), 0.0)
+        new_cost = (new_r*new_r).sum(axis=1)
+
+        improved = ok & (new_cost <= a_cost)
+        vh[active] = np.where(improved, new_vh, a_vh)
+        tau[active] = np.where(improved, new_tau, a_tau)
+        cost[active] = np.where(improved, new_cost, a_cost)
+        lam[active] = np.where(improved, a_lam/10.0, a_lam*10.0)
+
+        done = improved & (a_cost - new_cost <= tol*np.maximum(a_cost, tol))
+        converged[active[done]] = True
+        active = active[~done & ~(a_lam*10.0 > 1e10)]
+
+    return np.column_stack((vh, tau)), np.sqrt(cost), converged
+
+
+def _refit_inf(v, y, popt, resid) -> tuple:
+    """
+    Fits one curve with fit_inf_popt and keeps whichever of that and
+    (popt, resid) has the lower residual
+    """
+    finite = np.isfinite(y)
+    if finite.sum() < 2:
+        return popt, resid
+    v, y = v[finite], y[finite]
+    try:
+        refit, _ = fit_inf_popt(v, y)
+    except (RuntimeError, ValueError):
+        return popt, resid
+    refit_resid = np.linalg.norm(y-inf_func(v, *refit))
+    if not refit_resid < resid:
+        return popt, resid
+    return refit, refit_resid
+
+
+def fit_inf_batch(Y, v, max_iter:int=100, tol:float=1e-8, chunk_size:int=1024) -> tuple:
+    """
+    Fits every row of Y (N_curves x N_voltages) sampled at voltages v
+    to inf_func at once. Returns (popt, resid) where popt is an
+    (N_curves x 2) array of (vh, tau) and resid the residual norm of each fit.
+    Curves that didn't converge or whose V1/2 lands outside v, where the
+    logit start can lead to a poor local minimum, are refit one at a time
+    with fit_inf_popt and keep the better of the two fits
+    """
+    v = np.asarray(v, dtype=float)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    if Y.shape[1] != v.shape[0]:
+        raise ValueError("Y must have one column per voltage, got {} and {}".format(Y.shape, v.shape))
+
+    popt = np.empty((Y.shape[0], 2))
+    resid = np.empty(Y.shape[0])
+    converged = np.empty(Y.shape[0], dtype=bool)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'), timed("fit_inf_batch"):
+        for start in range(0, Y.shape[0], chunk_size):
+            stop = start + chunk_size
+            popt[start:stop], resid[start:stop], converged[start:stop] = _fit_inf_chunk(v, Y[start:stop], max_iter, tol)
+
+        suspect = ~converged | ~np.isfinite(resid) | (-popt[:,0] < v.min()) | (-popt[:,0] > v.max())
+        for i in np.flatnonzero(suspect):
+            popt[i], resid[i] = _refit_inf(v, Y[i], popt[i], resid[i])
+    return popt, resid
+
+
+TAU_FORMS = {
+    "constant": ("c", ("c",)),
+    "bell": ("c + a/cosh((v - vh)/k)", ("c", "a", "vh", "k")),
+    "double_exponential": ("c + a/(exp((v - vh1)/k1) + exp(-(v - vh2)/k2))", ("c", "a", "vh1", "k1", "vh2", "k2")),
+    "constant_gaussian": ("c + a*exp(-((v - vh)/k)**2)", ("c", "a", "vh", "k")),
+}
+
+
+def _tau_p0(name:str, v, y) -> list:
+    """
+    Initial guesses for a tau form from the peak of the curve
+    """
+    c = float(np.min(y))
+    height = float(np.max(y)) - c
+    peak = float(v[np.argmax(y)])
+    above = v[y >= c + height/2.0]
+    k = max(float(above.max() - above.min())/2.0 if above.size else 0.0, (v.max() - v.min())/100.0)
+    return {
+        "constant": [float(np.mean(y))],
+        "bell": [c, height, peak, k],
+        "double_exponential": [c, 2.0*height, peak, k, peak, k],
+        "constant_gaussian": [c, height, peak, k],
+    }[name]
+
+
+def fit_tau_form(name:str, v, y) -> dict:
+    """
+    Fits y(v) to one of TAU_FORMS, returns {form, params, resid, aic}
+    with aic=inf if the fit failed
+    """
+    form, params = TAU_FORMS[name]
+    v = np.asarray(v, dtype=float)
+    y = np.asarray(y, dtype=float)
+    result = {"form": name, "params": None, "resid": float("inf"), "aic": float("inf")}
+    try:
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            popt, resid = fit_form(form, params, v, y, p0=_tau_p0(name, v, y))
+    except (RuntimeError, ValueError) as e:
+        result["error"] = str(e)
+        return result
+    if not np.isfinite(resid):
+        return result
+
+    n = v.shape[0]
+    rss = max(float(resid)**2, np.finfo(float).tiny)
+    result.update({
+        "params": dict(zip(params, (float(p) for p in popt))),
+        "resid": float(resid),
+        "aic": float(n*np.log(rss/n) + 2*len(params)),
+    })
+    return result
+
+
+def tau_form_expression(name:str, params:dict, digits:int=6) -> str:
+    """
+    The tau form with fitted parameter values substituted
+    """
+    import re
+
+    form = TAU_FORMS[name][0]
+    return re.sub(r"\b(" + "|".join(params) + r")\b",
+        lambda m: "({:.{}g})".format(params[m.group(1)], digits), form)
+
+
+def select_tau_form(candidates:list, criterion:str="aic") -> dict:
+    """
+    Picks the best fit_tau_form result by aic or resid and returns
+    {form, expression, params, resid, aic, candidates}
+    """
+    best = min(candidates, key=lambda c: c[criterion])
+    result = dict(best)
+    result["expression"] = tau_form_expression(best["form"], best["params"]) if best["params"] else None
+    result["candidates"] = {c["form"]: {"resid": c["resid"], "aic": c["aic"]} for c in candidates}
+    return result
+
+
+def fit_tau_batch(curves, v, forms=None, criterion:str="aic", jobs:int=1) -> list:
+    """
+    Fits every tau curve (rows of curves, sampled at v) to each of the
+    given forms (all TAU_FORMS by default) and selects the best per curve.
+    The (curve, form) fits are spread over a process pool of jobs workers
+    (None for one per core)
+    """
+    forms = list(forms or TAU_FORMS)
+    v = np.asarray(v, dtype=float)
+    curves = np.atleast_2d(np.asarray(curves, dtype=float))
+    tasks = [(name, v, y) for y in curves for name in forms]
+
+    if jobs == 1:
+        results = [fit_tau_form(*task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(fit_tau_form, *zip(*tasks)))
+
+    return [select_tau_form(results[i:i + len(forms)], criterion) for i in range(0, len(results), len(forms))]
@@ -5,31 +5,48 @@ Created on Tues Sept 18 20:11:54 CST 2020
 """
 
 import os
+import queue
 import threading
 import matplotlib
 import numpy as np
-from scipy.optimize import curve_fit
-from scipy.special import expit
-import sympy
+
+from . import profiling, symbolic
+from .expressions import evaluate
+from .distance import DEFAULT_EQUATION, EUCLIDEAN_EQUATION
+from .batch import read_channels
+from .utils import simplify_expression
+from .plotting import compute_curves, compute_fit, compute_q10_sweep, compute_overlay, draw_rates, draw_inf, draw_tau, draw_regression, draw_q10_sweep, draw_overlay, style_overlay, arrow_segments, BlitManager
 
 matplotlib.use("TkAgg")
 
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 import matplotlib.pyplot as plt
 
 try:
     import Tkinter as tk # this is for python2
     import ttk
     import tkMessageBox as messagebox
+    import tkFileDialog as filedialog
 except:
     import tkinter as tk # this is for python3
     from tkinter import ttk
     from tkinter import messagebox
+    from tkinter import filedialog
 
 matplotlib.use("TkAgg")
 
 
+class TimedFigureCanvas(FigureCanvasTkAgg):
+    """
+    FigureCanvasTkAgg that records its render times under the "draw" stage
+    """
+    def draw(self):
+        with profiling.timed("draw"):
+            super(TimedFigureCanvas, self).draw()
+
+
 class Autoresized_Notebook(ttk.Notebook):
     def __init__(self, master=None, **kw):
         ttk.Notebook.__init__(self, master, **kw)
@@ -153,6 +170,79 @@ class Row(tk.Frame):
         self.root.grid(*args,**kwargs)
 
 
+class BackgroundWorker():
+    """
+    Runs jobs on a worker thread and hands their results back to the Tk
+    thread through root.after. A job is a generator function yielding
+    (status message, callback, result) steps; each callback is called with
+    its result on the Tk thread. Starting a job cancels the one in flight,
+    whose remaining steps are discarded and whose running simplification
+    is killed. When a job finishes the time spent in each profiled stage
+    is shown with the final status and its done callback is called
+    """
+    def __init__(self, root, status, poll_interval=50):
+        self.root = root
+        self.status = status
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue()
+        self.job_id = 0
+        self.running = False
+        self.since = {}
+        self.thread = None
+        self.done = None
+
+    def start(self, job, *args, done=None):
+        self.cancel()
+        self.since = profiling.totals()
+        self.done = done
+        self.thread = threading.Thread(target=self._run, args=(self.job_id, job, args), daemon=True)
+        self.thread.start()
+        if not self.running:
+            self.running = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def cancel(self):
+        self.job_id += 1
+        if self.thread is not None and self.thread.is_alive():
+            symbolic.interrupt()
+
+    def _run(self, job_id, job, args):
+        try:
+            for step in job(*args):
+                if job_id != self.job_id:
+                    return
+                self.queue.put((job_id,) + tuple(step))
+            self.queue.put((job_id, "Ready", None, None))
+        except Exception as e:
+            self.queue.put((job_id, "Error: " + str(e), None, None))
+
+    def _poll(self):
+        done = False
+        while True:
+            try:
+                job_id, message, callback, result = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job_id != self.job_id:
+                continue
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception as e:
+                    message = "Error: " + str(e)
+            if message is not None:
+                done = message == "Ready" or message.startswith("Error: ")
+                timings = profiling.summary(since=self.since) if done else ""
+                self.status(message + (" (" + timings + ")" if timings else ""))
+        if done:
+            self.running = False
+            callback, self.done = self.done, None
+            if callback is not None:
+                callback()
+        else:
+            self.root.after(self.poll_interval, self._poll)
+
+
 class NeuronEQWindow():
 
     def __init__(self):
@@ -170,6 +260,19 @@ class NeuronEQWindow():
         self.app_status = tk.StringVar(self.root,'')
         self.reset_app_status()
 
+        self.worker = BackgroundWorker(self.root, self.display_app_status)
+
+        #Slider driven plots are redrawn at most once per frame (ms)
+        self.frame_interval = 33
+        self.distance_plot_pending = None
+
+        #Channel set overlaid on the parameter plots
+        self.overlay = None
+        self.overlay_channels = None
+        self.overlay_collections = {}
+        self.overlay_blitters = {}
+        self.overlay_hidden = set()
+
     def display(self):
         self.main()
 
@@ -223,72 +326,64 @@ class NeuronEQWindow():
         frame.update()
         canvas.config(scrollregion=canvas.bbox("all"))
 
-    def plot_distance_page(self,*args):
-        self.distanceplot.clear()
-        
-        src_pos = self.src_pos_row.value()
-        src_pos = np.array(eval(src_pos))
-        trg_pos = self.trg_pos_row.value()
-        trg_pos = np.array(eval(trg_pos))
+    def schedule_distance_plot(self,*args):
+        """
+        Coalesces slider events so the distance plot is redrawn at most
+        once per frame interval, with whatever values are current by then
+        """
+        if self.distance_plot_pending is None:
+            self.distance_plot_pending = self.root.after(self.frame_interval, self.run_scheduled_distance_plot)
 
-        def replace_trig(string):
-            return string.replace("cos(","np.cos(").replace("sin(","np.sin(").replace("tan(","np.tan(").replace("pi","np.pi")
-        
-        src_angle_x = self.src_angle_x_row.value()
-        src_angle_x = replace_trig(src_angle_x)
-        src_angle_x = eval(src_angle_x)
+    def run_scheduled_distance_plot(self):
+        self.distance_plot_pending = None
+        self.plot_distance_page()
 
-        src_angle_y = self.src_angle_y_row.value()
-        src_angle_y = replace_trig(src_angle_y)
-        src_angle_y = eval(src_angle_y)
+    def plot_distance_page(self,*args):
+        src_pos = np.array(evaluate(self.src_pos_row.value()))
+        trg_pos = np.array(evaluate(self.trg_pos_row.value()))
 
-        src_angle_z = self.src_angle_z_row.value()
-        src_angle_z = replace_trig(src_angle_z)
-        src_angle_z = eval(src_angle_z)
+        src_angle_x = evaluate(self.src_angle_x_row.value())
+        src_angle_y = evaluate(self.src_angle_y_row.value())
+        src_angle_z = evaluate(self.src_angle_z_row.value())
 
-        vec_pos = self.vec_pos_row.value()
-        vec_pos = replace_trig(vec_pos)
-        vec_pos = np.array(eval(vec_pos))
+        vec_pos = np.array(evaluate(self.vec_pos_row.value(),
+            src_angle_x=src_angle_x, src_angle_y=src_angle_y, src_angle_z=src_angle_z))
 
-        eq = self.equation_row.value()
-        dist = eval(replace_trig(eq))
+        dist = evaluate(self.equation_row.value(), src_pos=src_pos, trg_pos=trg_pos, vec_pos=vec_pos)
 
         true_dist = np.linalg.norm(trg_pos-src_pos)
         
         #print(dist)
 
-        self.distanceplot.scatter(src_pos[0],src_pos[1],src_pos[2],marker='o',s=100,c='b',label='src_pos')
-        self.distanceplot.scatter(trg_pos[0],trg_pos[1],trg_pos[2],marker='o',s=100,c='r',label='trg_pos')
-        self.distanceplot.scatter(vec_pos[0],vec_pos[1],vec_pos[2],marker='x',s=100,c='g',label='vec_pos')
+        # The points, arrows and legend are created once and updated in place
+        points = {'src_pos':src_pos, 'trg_pos':trg_pos, 'vec_pos':vec_pos}
+        if not self.distance_points:
+            for name, marker, color in (('src_pos','o','b'), ('trg_pos','o','r'), ('vec_pos','x','g')):
+                self.distance_points[name], = self.distanceplot.plot([],[],[],linestyle='',marker=marker,markersize=10,color=color,label=name)
+            for name, color in (('euclid','blue'), ('vec','green'), ('dist','orange')):
+                self.distance_arrows[name] = Line3DCollection([],colors=color)
+                self.distanceplot.add_collection3d(self.distance_arrows[name],autolim=False)
+            handles = list(self.distance_points.values()) + [self.distance_arrows['euclid'], self.distance_arrows['dist']]
+            self.distance_legend = self.distanceplot.legend(handles, [h.get_label() for h in handles[:3]] + ['', ''])
 
-        try:
-            self.distanceplot.quiver(src_pos[0],src_pos[1],src_pos[2],(trg_pos[0]-src_pos[0]),(trg_pos[1]-src_pos[1]),(trg_pos[2]-src_pos[2]),
-            pivot='tail',length=true_dist,label="euclid: {:.4f}".format(true_dist),color='blue',normalize=True)
-        except Exception as e:
-            print(e)
+        for name, pos in points.items():
+            self.distance_points[name].set_data_3d([pos[0]],[pos[1]],[pos[2]])
 
         src_vec_dist = np.linalg.norm(vec_pos-src_pos)
-        try:
-            self.distanceplot.quiver(src_pos[0],src_pos[1],src_pos[2],(vec_pos[0]-src_pos[0]),(vec_pos[1]-src_pos[1]),(vec_pos[2]-src_pos[2]),
-            pivot='tail',length=src_vec_dist*1000,color='green',normalize=True)
-        except Exception as e:
-            print(e)
-
-        #vec_trg_dist = np.linalg.norm(trg_pos-vec_pos)
-        #try:
-        #    self.distanceplot.quiver(vec_pos[0],vec_pos[1],vec_pos[2],(trg_pos[0]-vec_pos[0]),(trg_pos[1]-vec_pos[1]),(trg_pos[2]-vec_pos[2]),
-        #    pivot='tail',length=vec_trg_dist,label="{:.4f}".format(vec_trg_dist),color='green',normalize=True)
-        #except Exception as e:
-        #    print(e)
-
-        try:
-            self.distanceplot.quiver(vec_pos[0],vec_pos[1],vec_pos[2],(trg_pos[0]-vec_pos[0]),(trg_pos[1]-vec_pos[1]),(trg_pos[2]-vec_pos[2]),
-            pivot='tail',length=dist,label="{:.4f}".format(dist),color='orange',normalize=True)
-        except Exception as e:
-            print(e)
-
-        self.distanceplot.legend()
-        self.distancecanvas.draw()
+        arrows = {
+            'euclid': arrow_segments(src_pos, trg_pos-src_pos, true_dist),
+            'vec': arrow_segments(src_pos, vec_pos-src_pos, src_vec_dist*1000),
+            'dist': arrow_segments(vec_pos, trg_pos-vec_pos, dist),
+        }
+        for name, segments in arrows.items():
+            self.distance_arrows[name].set_segments(segments)
+        texts = self.distance_legend.get_texts()
+        texts[3].set_text("euclid: {:.4f}".format(true_dist))
+        texts[4].set_text("{:.4f}".format(dist))
+
+        all_points = np.array(list(points.values()) + [point for segments in arrows.values() for segment in segments for point in segment])
+        self.distanceplot.auto_scale_xyz(all_points[:,0],all_points[:,1],all_points[:,2],had_data=False)
+        self.distancecanvas.draw_idle()
         #v = self.v
         #alpha_expression = self.alpha_row.value()
         #alpha_expression = alpha_expression.replace("exp(","np.exp(")
@@ -313,8 +408,10 @@ class NeuronEQWindow():
         self.distance_figure = Figure(figsize=(8,3), dpi=100)
         self.distanceplot = self.distance_figure.add_subplot(111,projection='3d')
         self.distanceplot.title.set_text('3D Plane')
+        self.distance_points = {}
+        self.distance_arrows = {}
         #Create the canvas for the membrane vs time graph.
-        self.distancecanvas = FigureCanvasTkAgg(self.distance_figure,top_option_frame)
+        self.distancecanvas = TimedFigureCanvas(self.distance_figure,top_option_frame)
         self.distancecanvas.draw()
         self.distancecanvas.get_tk_widget().grid(column = 0, row = 1)
         distancetoolbar_frame = tk.Frame(master=top_option_frame)
@@ -337,7 +434,7 @@ class NeuronEQWindow():
         self.trg_pos_row = Row(general_frame).config("trg_pos", "[1,1,1]" , pos_hint , True,entry_width=100)
         self.trg_pos_row.pack(padx=10)
 
-        plot_distance_page = self.plot_distance_page
+        plot_distance_page = self.schedule_distance_plot
         self.src_angle_x_row = Row(general_frame).config("src_angle_x", "pi/2" , "in radians" , True,scale=True,scale_command=plot_distance_page)
         self.src_angle_x_row.pack(padx=10)
         self.src_angle_y_row = Row(general_frame).config("src_angle_y", "pi/2" , "in radians" , True,scale=True,scale_command=plot_distance_page)
@@ -349,12 +446,12 @@ class NeuronEQWindow():
         self.vec_pos_row = Row(general_frame).config("vec_pos", "[cos(src_angle_x), sin(src_angle_y), sin(src_angle_x)]" , vec_pos_hint , True,entry_width=100)
         self.vec_pos_row.pack(padx=10)
 
-        equation = "np.linalg.norm(np.cross((trg_pos - src_pos), (trg_pos - vec_pos))) / np.linalg.norm((vec_pos - src_pos))"
+        equation = DEFAULT_EQUATION
         self.equation_row = Row(general_frame).config("Distance Equation", equation , "Use src_pos,trg_pos,vec_pos", True,entry_width=100)
         self.equation_row.pack(padx=10)
 
         def euclid():
-            self.equation_row.set_value("np.linalg.norm(trg_pos - src_pos)")
+            self.equation_row.set_value(EUCLIDEAN_EQUATION)
             self.plot_distance_page(disable_vec_trg=True)
         
         def angle():
@@ -384,10 +481,12 @@ class NeuronEQWindow():
         top_option_frame = tk.LabelFrame(root, text="Plots")
         table_frame = tk.Frame(root)
         import_export_frame = tk.LabelFrame(root, text="Import/Export")
+        q10_frame = tk.LabelFrame(root, text="Temperature (Q10)")
         
         top_option_frame.grid(column=0,row=0,sticky='news',padx=10,pady=5)
         table_frame.grid(column=0,row=1,sticky='news',padx=10,pady=5)
         import_export_frame.grid(column=1,row=0,sticky='news',padx=10,pady=5)
+        q10_frame.grid(column=0,row=2,sticky='news',padx=10,pady=5)
 
         general_frame = tk.LabelFrame(table_frame, text="Input",fg="red",width=200)
         general_frame.grid(column=0,row=0,sticky='news',padx=10,pady=5)
@@ -397,104 +496,180 @@ class NeuronEQWindow():
 
         row_header = ['variable','value','comment','value_is_string']
         rows=[]
+        self.curves = None
         
-        def inf_func(v,vh,tau):
-            return 1.0/(1.0+(np.exp((v+vh)/(tau))))
-            #return expit((v+vh)/tau)
+        def fit_inf_job(curves):
+            yield "Fitting x_inf", None, None
+            yield None, show_fit, compute_fit(curves["v"], curves["inf"], fast=True, expression=curves["inf_expression"])
 
-        def fit_inf():
-            
-            v = self.v
-
-            self.betaplot.clear()
-            self.betaplot.title.set_text('x_inf regression')
-            inf_expression = self.alpha_row.value() + "/( " + self.alpha_row.value() + " + " + self.beta_row.value() + ")"
-            inf_expression_np = inf_expression.replace("exp(","np.exp(")
-            y = eval(inf_expression_np)
-            self.betaline = self.betaplot.plot(self.v,y,label="original")
-            
-
-            popt_n, pcov_n = curve_fit(inf_func, v, self.inf_y,bounds=((-1000,-1000),(1000,-0.00001)))
-            popt_p, pcov_p = curve_fit(inf_func, v, self.inf_y,bounds=((-1000,0.00001),(1000,1000)))
-            
-            resid_n = np.linalg.norm(y-inf_func(v, *popt_n))
-            resid_p = np.linalg.norm(y-inf_func(v, *popt_p))
-            
-            if resid_n <= resid_p:
-                popt = popt_n
-            else:
-                popt = popt_p
-            #print(popt)
-            self.betaplot.plot(self.v, inf_func(self.v, *popt), 'r-',label="fit")
-
-            inf_func_vh = "vhalf"
-            inf_func_tau = "tau"
-            
-            inf_func_vh = round(popt[0],2)
-            inf_func_tau = round(popt[1],2)
-            inf_func_str = "1.0/(1.0+(exp((v+" + str(inf_func_vh) + ")/("+ str(inf_func_tau)+"))))"
-
-            inf_func_k = -round(1.0/float(popt[1]),4)
-
-            self.fit_inf_row.set_value(inf_func_str)
-            self.fit_inf_vh_row.set_value(-inf_func_vh)
-            self.fit_inf_tau_row.set_value(inf_func_k)
-
-            self.betaplot.legend()
+        def show_fit(fit):
+            draw_regression(self.betaplot, self.curves, fit)
+            attach_overlay()
             self.betacanvas.draw()
 
-        def plot():
-            self.alphaplot.clear()
-            self.alphaplot.title.set_text('x_alpha/x_beta')
-            self.v = np.linspace(float(self.min_row.value()),float(self.max_row.value()),2000)
-            v = self.v
-            alpha_expression = self.alpha_row.value()
-            alpha_expression = alpha_expression.replace("exp(","np.exp(")
-            y = eval(alpha_expression)
-            self.alphaline = self.alphaplot.plot(self.v,y,label='Alpha')
-
-            beta_expression = self.beta_row.value()
-            beta_expression = beta_expression.replace("exp(","np.exp(")
-            y = eval(beta_expression)
-            self.betaline = self.alphaplot.plot(self.v,y,label='Beta')
-            self.alphaplot.legend()
-            self.alphacanvas.draw()
+            self.fit_inf_row.set_value(fit["inf_func_str"])
+            self.fit_inf_vh_row.set_value(fit["vhalf"])
+            self.fit_inf_tau_row.set_value(fit["k"])
 
-            self.infplot.clear()
-            self.infplot.title.set_text('x_inf')
-            inf_expression = self.alpha_row.value() + "/( " + self.alpha_row.value() + " + " + self.beta_row.value() + ")"
-            inf_expression_np = inf_expression.replace("exp(","np.exp(")
-            self.inf_y = eval(inf_expression_np)
-            self.infline = self.infplot.plot(self.v,self.inf_y)
+        def fit_inf():
+            self.worker.start(fit_inf_job, self.curves)
+
+        def plot_job(alpha, beta, min_v, max_v, points, tol, timeout, overlay, overlay_channels):
+            yield "Evaluating equations", None, None
+            curves = compute_curves(alpha, beta, min_v, max_v, points=points, tol=tol)
+            #The overlay follows the voltage range, it's drawn again with the curves
+            if overlay is not None and (overlay["v"][0], overlay["v"][-1]) != (float(min_v), float(max_v)):
+                yield None, set_overlay, compute_overlay(overlay_channels, min_v, max_v)
+            yield "Simplifying x_inf", show_curves, curves
+            #Calculate the functions symbolically, should be able to use tau directly
+            #One step each, so a replaced job stops between them
+            yield "Simplifying x_tau", self.calc_inf_row.set_value, simplify_expression(curves["inf_expression"], timeout)
+            yield None, self.calc_tau_row.set_value, simplify_expression(curves["tau_expression"], timeout)
+
+        def show_curves(curves):
+            self.curves = curves
+            self.v = curves["v"]
+            self.inf_y = curves["inf"]
+
+            draw_rates(self.alphaplot, curves)
+            draw_inf(self.infplot, curves)
+            draw_regression(self.betaplot, curves)
+            draw_tau(self.tauplot, curves)
+            attach_overlay()
+            self.alphacanvas.draw()
             self.infcanvas.draw()
-
-            self.betaplot.clear()
-            self.betaplot.title.set_text('x_inf regression')
-            self.betaline = self.betaplot.plot(self.v,self.inf_y,label="original")
             self.betacanvas.draw()
-
-            self.tauplot.clear()
-            self.tauplot.title.set_text('x_tau')
-            tau_expression = "1/( " + self.alpha_row.value() + " + " + self.beta_row.value() + ")"
-            tau_expression_np = tau_expression.replace("exp(","np.exp(")
-            y = eval(tau_expression_np)
-            self.tauline = self.tauplot.plot(self.v,y)
             self.taucanvas.draw()
-            
-            #Enable the fit button
-            self.fitInfButton.config(state=tk.ACTIVE)
 
-            #Calculate the functions symbolically, should be able to use tau directly
-            inf_calc = sympy.simplify(inf_expression)
-            tau_calc = sympy.simplify(tau_expression)
-            
-            self.calc_inf_row.set_value(inf_calc)
-            self.calc_tau_row.set_value(tau_calc)
+        def set_job_buttons(state):
+            """
+            Fit, Q10 and Load Channel Set start jobs of their own, which
+            would replace the plot job before its equations are simplified
+            """
+            for button in (self.fitInfButton, q10Button, loadOverlayButton):
+                button.config(state=state)
+
+        def plot_done():
+            set_job_buttons(tk.NORMAL)
+            #Nothing to fit if the equations couldn't be evaluated
+            if self.curves is None:
+                self.fitInfButton.config(state=tk.DISABLED)
 
+        def plot():
+            #Inputs are checked before anything is disabled or cleared
+            try:
+                points = int(float(self.points_row.value()))
+                tol = self.tol_row.value().strip()
+                tol = float(tol) if tol else None
+                timeout = self.simplify_timeout_row.value().strip()
+                timeout = float(timeout) if timeout else None
+            except ValueError as e:
+                self.display_app_status("Error: " + str(e))
+                return
+
+            set_job_buttons(tk.DISABLED)
+            self.curves = None
+            self.calc_inf_row.set_value("")
+            self.calc_tau_row.set_value("")
             self.fit_inf_row.set_value("")
             self.fit_inf_vh_row.set_value("")
             self.fit_inf_tau_row.set_value("")
 
+            self.worker.start(plot_job, self.alpha_row.value(), self.beta_row.value(),
+                self.min_row.value(), self.max_row.value(), points, tol, timeout,
+                self.overlay, self.overlay_channels, done=plot_done)
+
+        def overlay_job(path, min_v, max_v):
+            yield "Loading channel set", None, None
+            with open(path) as f:
+                channels = list(read_channels(f))
+            yield None, show_overlay, (channels, compute_overlay(channels, min_v, max_v))
+
+        def overlay_axes():
+            return {"rates": (self.alphaplot, self.alphacanvas), "inf": (self.infplot, self.infcanvas),
+                "tau": (self.tauplot, self.taucanvas), "regression": (self.betaplot, self.betacanvas)}
+
+        def attach_overlay():
+            """
+            (Re)adds the overlay collections, the axes may have been cleared
+            """
+            for collection in self.overlay_collections.values():
+                if collection.axes is not None:
+                    collection.remove()
+            for blitter in self.overlay_blitters.values():
+                blitter.disconnect()
+            self.overlay_collections, self.overlay_blitters = {}, {}
+            if self.overlay is None:
+                return
+            axes = overlay_axes()
+            self.overlay_collections = draw_overlay({key: ax for key, (ax, canvas) in axes.items()}, self.overlay)
+            self.overlay_blitters = {key: BlitManager(axes[key][1], [collection]) for key, collection in self.overlay_collections.items()}
+            restyle_overlay(blit=False)
+
+        def restyle_overlay(*args, blit=True):
+            """
+            Highlights the selected channels and hides toggled ones, only the
+            overlay collections are redrawn
+            """
+            if self.overlay is None:
+                return
+            style_overlay(self.overlay_collections, len(self.overlay["names"]), self.overlay_hidden, overlay_list.curselection())
+            if blit:
+                for blitter in self.overlay_blitters.values():
+                    blitter.update()
+
+        def set_overlay(overlay):
+            """
+            Replaces the overlay curves of the loaded channel set, eg for a
+            new voltage range. The list and hidden channels stay as they are
+            """
+            self.overlay = overlay
+
+        def show_overlay(loaded):
+            self.overlay_channels, overlay = loaded
+            self.overlay = overlay
+            self.overlay_hidden = set()
+            overlay_list.delete(0, tk.END)
+            for name in overlay["names"]:
+                overlay_list.insert(tk.END, name)
+            attach_overlay()
+            for ax, canvas in overlay_axes().values():
+                canvas.draw()
+            if overlay["errors"]:
+                messagebox.showwarning("Channel Overlay", "Skipped " + str(len(overlay["errors"])) + " channels:\n" + "\n".join(overlay["errors"][:10]))
+
+        def load_overlay():
+            path = filedialog.askopenfilename(title="Load Channel Set", filetypes=[("Channel sets", "*.csv *.jsonl *.json"), ("All files", "*")])
+            if path:
+                self.worker.start(overlay_job, path, self.min_row.value(), self.max_row.value())
+
+        def toggle_overlay():
+            for i in overlay_list.curselection():
+                self.overlay_hidden ^= {i}
+                overlay_list.itemconfig(i, fg="gray" if i in self.overlay_hidden else "black")
+            restyle_overlay()
+
+        def clear_overlay():
+            self.overlay = self.overlay_channels = None
+            overlay_list.delete(0, tk.END)
+            attach_overlay()
+            for ax, canvas in overlay_axes().values():
+                canvas.draw()
+
+        def q10_job(*args):
+            yield "Sweeping temperatures", None, None
+            yield None, show_q10, compute_q10_sweep(*args)
+
+        def show_q10(sweep):
+            draw_q10_sweep(self.q10graph, sweep)
+            self.q10canvas.draw()
+
+        def plot_q10():
+            self.worker.start(q10_job, self.alpha_row.value(), self.beta_row.value(),
+                self.min_row.value(), self.max_row.value(),
+                self.q10_min_row.value(), self.q10_max_row.value(),
+                self.q10_alpha_row.value(), self.q10_beta_row.value(), self.q10_base_row.value())
+
         def param_changed(*args,val=True):
             param_has_changed = val
 
@@ -532,7 +707,7 @@ class NeuronEQWindow():
         self.alphaplot = self.alphagraph.add_subplot(111)
         self.alphaplot.title.set_text('x_alpha/x_beta')
         #Create the canvas for the membrane vs time graph.
-        self.alphacanvas = FigureCanvasTkAgg(self.alphagraph,top_option_frame)
+        self.alphacanvas = TimedFigureCanvas(self.alphagraph,top_option_frame)
         self.alphacanvas.draw()
         self.alphacanvas.get_tk_widget().grid(column = 0, row = 1)
         alphatoolbar_frame = tk.Frame(master=top_option_frame)
@@ -545,7 +720,7 @@ class NeuronEQWindow():
         self.betaplot = self.betagraph.add_subplot(111)
         self.betaplot.title.set_text('x_inf regression')
         #Create the canvas for the membrane vs time graph.
-        self.betacanvas = FigureCanvasTkAgg(self.betagraph,top_option_frame)
+        self.betacanvas = TimedFigureCanvas(self.betagraph,top_option_frame)
         self.betacanvas.draw()
         self.betacanvas.get_tk_widget().grid(column = 1, row = 3)
         betatoolbar_frame = tk.Frame(master=top_option_frame)
@@ -558,7 +733,7 @@ class NeuronEQWindow():
         self.infplot = self.infgraph.add_subplot(111)
         self.infplot.title.set_text('x_inf')
         #Create the canvas for the membrane vs time graph.
-        self.infcanvas = FigureCanvasTkAgg(self.infgraph,top_option_frame)
+        self.infcanvas = TimedFigureCanvas(self.infgraph,top_option_frame)
         self.infcanvas.draw()
         self.infcanvas.get_tk_widget().grid(column = 1, row = 1)
         inftoolbar_frame = tk.Frame(master=top_option_frame)
@@ -571,7 +746,7 @@ class NeuronEQWindow():
         self.tauplot = self.taugraph.add_subplot(111)
         self.tauplot.title.set_text('x_tau')
         #Create the canvas for the membrane vs time graph.
-        self.taucanvas = FigureCanvasTkAgg(self.taugraph,top_option_frame)
+        self.taucanvas = TimedFigureCanvas(self.taugraph,top_option_frame)
         self.taucanvas.draw()
         self.taucanvas.get_tk_widget().grid(column = 0, row = 3)
         tautoolbar_frame = tk.Frame(master=top_option_frame)
@@ -593,6 +768,12 @@ class NeuronEQWindow():
         self.min_row.pack(padx=10)
         self.max_row = Row(general_frame).config("Max Voltage", "50", "Maximum Voltage", True)
         self.max_row.pack(padx=10)
+        self.points_row = Row(general_frame).config("Sample Points", "2000", "Evenly spaced points used when the tolerance is empty. Plots are downsampled for display, fits use every point", True)
+        self.points_row.pack(padx=10)
+        self.tol_row = Row(general_frame).config("Sample Tolerance", "1e-4", "Adaptive sampling tolerance, relative to each curve's range. Leave empty to use Sample Points", True)
+        self.tol_row.pack(padx=10)
+        self.simplify_timeout_row = Row(general_frame).config("Simplify Timeout", "10", "Seconds allowed for simplifying x_inf/x_tau, the best form found by then is shown", True)
+        self.simplify_timeout_row.pack(padx=10)
     
         Row(general_frame).pack(pady=padtopbot)
 
@@ -606,6 +787,47 @@ class NeuronEQWindow():
         self.fitInfButton.pack()
         self.fitInfButton.config(state=tk.DISABLED)
 
+        #Channel set overlay
+        loadOverlayButton = tk.Button(import_export_frame, text="Load Channel Set...", command=load_overlay)
+        loadOverlayButton.pack(fill=tk.X, padx=5, pady=2)
+        overlay_list_frame = tk.Frame(import_export_frame)
+        overlay_list_frame.pack(fill=tk.BOTH, expand=True, padx=5)
+        overlay_scrollbar = tk.Scrollbar(overlay_list_frame)
+        overlay_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        overlay_list = tk.Listbox(overlay_list_frame, selectmode=tk.EXTENDED, exportselection=False, height=20, width=24, yscrollcommand=overlay_scrollbar.set)
+        overlay_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        overlay_scrollbar.config(command=overlay_list.yview)
+        overlay_list.bind("<<ListboxSelect>>", restyle_overlay)
+        tk.Button(import_export_frame, text="Show/Hide Selected", command=toggle_overlay).pack(fill=tk.X, padx=5, pady=2)
+        tk.Button(import_export_frame, text="Clear Overlay", command=clear_overlay).pack(fill=tk.X, padx=5, pady=2)
+
+        #Temperature sweep heatmaps
+        self.q10graph = Figure(figsize=(8,2.5), dpi=100)
+        self.q10canvas = TimedFigureCanvas(self.q10graph,q10_frame)
+        self.q10canvas.draw()
+        self.q10canvas.get_tk_widget().grid(column = 0, row = 1, rowspan = 2)
+        q10toolbar_frame = tk.Frame(master=q10_frame)
+        q10toolbar_frame.grid(column=0,row=0,sticky='w')
+        q10toolbar = NavigationToolbar2Tk(self.q10canvas,q10toolbar_frame)
+        q10toolbar.update()
+
+        q10_input_frame = tk.Frame(q10_frame)
+        q10_input_frame.grid(column=1,row=1,sticky='news',padx=10,pady=5)
+        self.q10_min_row = Row(q10_input_frame).config("Min Celsius", "6.3", "Lowest temperature of the sweep", True)
+        self.q10_min_row.pack(padx=10)
+        self.q10_max_row = Row(q10_input_frame).config("Max Celsius", "37", "Highest temperature of the sweep", True)
+        self.q10_max_row.pack(padx=10)
+        self.q10_alpha_row = Row(q10_input_frame).config("Q10 Alpha", "3", "Q10 of the alpha rate", True)
+        self.q10_alpha_row.pack(padx=10)
+        self.q10_beta_row = Row(q10_input_frame).config("Q10 Beta", "3", "Q10 of the beta rate", True)
+        self.q10_beta_row.pack(padx=10)
+        self.q10_base_row = Row(q10_input_frame).config("Base Celsius", "6.3", "Temperature the rates were measured at", True)
+        self.q10_base_row.pack(padx=10)
+
+        q10Button = tk.Button(q10_input_frame, text="Plot Q10 Sweep", command=plot_q10)
+        q10Button.pack()
+        q10Button.config(state=tk.ACTIVE)
+
         #tk.Label(output_frame, text = "Additional output here...",width=55).pack()
 
         self.calc_inf_row = Row(output_frame).config("x_inf Calculated", "", "alpha/(alpha+beta)", True)
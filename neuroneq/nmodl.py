@@ -0,0 +1,271 @@
+"""
+NMODL (.mod) directory scanner
+
+Pulls alpha/beta (or inf/tau) expressions out of the PROCEDURE rates block
+of every .mod file in a directory (with calls to the file's FUNCTIONs such
+as vtrap inlined), converts them with ab2inf_tau/fit_inf and keeps the
+results in an on-disk index keyed by a hash of each file's contents, so
+re-scanning only processes files that changed.
+"""
+
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from .batch import convert_channel
+from .workers import load_json, save_json
+
+INDEX_FILE = ".neuroneq_index.json"
+INDEX_VERSION = 1
+DEFAULT_CELSIUS = 6.3
+
+_COMMENT_BLOCK = re.compile(r"\bCOMMENT\b.*?\bENDCOMMENT\b", re.S)
+_LINE_COMMENT = re.compile(r"[:?].*")
+_RATES = re.compile(r"\bPROCEDURE\s+(\w*rates\w*)\s*\(\s*(\w+)[^)]*\)?[^{]*\{", re.I)
+_PARAMETER = re.compile(r"\bPARAMETER\s*\{")
+_FUNCTION = re.compile(r"\bFUNCTION\s+(\w+)\s*\(((?:[^()]|\([^()]*\))*)\)[^{]*\{")
+_ASSIGNMENT = re.compile(r"^\s*(\w+)\s*=\s*(.+?)\s*$")
+_CONSTANT = re.compile(r"^\s*(\w+)\s*=\s*([-+0-9.eE]+)")
+_UNITS = re.compile(r"(?<=[\w.)])\s+\(\s*(?:[a-zA-Z/]+[0-9]*\s*)+\)\s*$")
+
+# Nested FUNCTION calls are inlined at most this many times per expression
+MAX_INLINE = 100
+
+_GATE_PATTERNS = {
+    "alpha": [r"^alpha_?(\w+)$", r"^(\w+?)_?alpha$", r"^a([a-z])$"],
+    "beta": [r"^beta_?(\w+)$", r"^(\w+?)_?beta$", r"^b([a-z])$"],
+    "inf": [r"^inf_?(\w+)$", r"^(\w+?)_?inf$"],
+    "tau": [r"^tau_?(\w+)$", r"^(\w+?)_?tau$"],
+}
+
+
+def file_hash(content:str) -> str:
+    """
+    Content hash used as the index key
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _strip_comments(content:str) -> str:
+    content = _COMMENT_BLOCK.sub("", content)
+    return "\n".join(_LINE_COMMENT.sub("", line) for line in content.splitlines())
+
+
+def _block(content:str, start:int) -> str:
+    """
+    Returns the body of the brace block whose opening brace ends at start
+    """
+    depth = 1
+    for i in range(start, len(content)):
+        if content[i] == "{":
+            depth += 1
+        elif content[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return content[start:i]
+    return content[start:]
+
+
+def _substitute(expression:str, values:dict) -> str:
+    if not values:
+        return expression
+    pattern = r"\b(" + "|".join(re.escape(name) for name in values) + r")\b"
+    return re.sub(pattern, lambda m: values[m.group(1)], expression)
+
+
+def _closing(text:str, start:int) -> int:
+    """
+    Index of the parenthesis closing the one that ends at start
+    """
+    depth = 1
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _arguments(text:str) -> list:
+    """
+    Splits a call's argument list on the commas outside parentheses
+    """
+    arguments, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            arguments.append(text[start:i].strip())
+            start = i + 1
+    arguments.append(text[start:].strip())
+    return arguments
+
+
+def _parse_functions(content:str, values:dict) -> dict:
+    """
+    Returns {name: (parameters, expression)} for the FUNCTION blocks that
+    compute a single expression of their parameters, eg vtrap and efun.
+    Locals are inlined, and when the result is assigned in several branches
+    the last one is kept, which is the general case in the usual
+    if (singular) {limit} else {general} layout
+    """
+    functions = {}
+    for match in _FUNCTION.finditer(content):
+        name = match.group(1)
+        parameters = [re.match(r"\s*(\w*)", parameter).group(1) for parameter in match.group(2).split(",")]
+        parameters = [parameter for parameter in parameters if parameter]
+        local = {key: value for key, value in values.items() if key not in parameters}
+        expression = None
+        for line in _block(content, match.end()).splitlines():
+            assignment = _ASSIGNMENT.match(line)
+            if not assignment:
+                continue
+            variable, value = assignment.groups()
+            value = _substitute(_UNITS.sub("", value), local)
+            if variable == name:
+                expression = value
+            elif variable not in parameters:
+                local[variable] = "(" + value + ")"
+        if expression is not None:
+            functions[name] = (parameters, expression)
+    return functions
+
+
+def _inline(expression:str, functions:dict) -> str:
+    """
+    Replaces calls to the file's FUNCTIONs with their expressions, with
+    the arguments substituted for the parameters. Calls that can't be
+    inlined are left for the conversion to report
+    """
+    if not functions:
+        return expression
+    pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in functions) + r")\s*\(")
+    position = 0
+    for _ in range(MAX_INLINE):
+        match = pattern.search(expression, position)
+        if not match:
+            break
+        end = _closing(expression, match.end())
+        parameters, body = functions[match.group(1)]
+        arguments = _arguments(expression[match.end():end])
+        if end < 0 or len(arguments) != len(parameters):
+            position = match.end()
+            continue
+        body = _substitute(body, {parameter: "(" + argument + ")" for parameter, argument in zip(parameters, arguments)})
+        # Rescanned from the same position so calls in the body and the arguments are inlined too
+        expression = expression[:match.start()] + "(" + body + ")" + expression[end + 1:]
+        position = match.start()
+    return expression
+
+
+def _gate_name(variable:str):
+    for kind, patterns in _GATE_PATTERNS.items():
+        for pattern in patterns:
+            match = re.match(pattern, variable, re.I)
+            if match:
+                return kind, match.group(1)
+    return None, None
+
+
+def parse_rates(content:str, celsius:float=DEFAULT_CELSIUS) -> list:
+    """
+    Returns a list of gate dicts {name, alpha, beta} or {name, inf, tau}
+    with expressions in terms of v, found in the rates procedure.
+    celsius is used when the file doesn't set it as a PARAMETER
+    """
+    content = _strip_comments(content)
+    match = _RATES.search(content)
+    if not match:
+        return []
+    voltage = match.group(2)
+    body = _block(content, match.end())
+
+    # Numeric PARAMETER values are inlined so expressions only depend on v
+    values = {"celsius": "(" + str(celsius) + ")"}
+    parameters = _PARAMETER.search(content)
+    if parameters:
+        for line in _block(content, parameters.end()).splitlines():
+            constant = _CONSTANT.match(line)
+            if constant:
+                values[constant.group(1)] = "(" + constant.group(2) + ")"
+    values.pop(voltage, None)
+    functions = _parse_functions(content, values)
+
+    gates = {}
+    for line in body.splitlines():
+        assignment = _ASSIGNMENT.match(line)
+        if not assignment:
+            continue
+        variable, expression = assignment.groups()
+        expression = _UNITS.sub("", expression)
+        expression = _inline(_substitute(expression, values), functions)
+        if voltage != "v":
+            expression = re.sub(r"\b" + re.escape(voltage) + r"\b", "v", expression)
+        values[variable] = "(" + expression + ")"
+
+        kind, gate = _gate_name(variable)
+        if kind:
+            gates.setdefault(gate, {})[kind] = expression
+
+    result = []
+    for gate, expressions in gates.items():
+        if "alpha" in expressions and "beta" in expressions:
+            result.append({"name": gate, "alpha": expressions["alpha"], "beta": expressions["beta"]})
+        elif "inf" in expressions:
+            result.append({"name": gate, "inf": expressions["inf"], "tau": expressions.get("tau", "")})
+    return result
+
+
+def process_mod(content:str, simplify:bool=True, fast:bool=False, celsius:float=DEFAULT_CELSIUS) -> list:
+    """
+    Parses a .mod file's contents and converts every gate found
+    """
+    return [convert_channel(gate, simplify=simplify, fast=fast) for gate in parse_rates(content, celsius)]
+
+
+def scan_directory(directory:str, index_path:str=None, jobs:int=None, simplify:bool=True, fast:bool=False, celsius:float=DEFAULT_CELSIUS) -> dict:
+    """
+    Scans directory (recursively) for .mod files and returns
+    {relative path: [gate results]}. Files whose contents are already in
+    the index are not processed again
+    """
+    if index_path is None:
+        index_path = os.path.join(directory, INDEX_FILE)
+    index = load_json(index_path, INDEX_VERSION, {"simplify": simplify, "fast": fast, "celsius": celsius}, {"files": {}, "entries": {}})
+
+    files = {}
+    contents = {}
+    for root, dirs, names in os.walk(directory):
+        for name in sorted(names):
+            if not name.endswith(".mod"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, errors="replace") as f:
+                content = f.read()
+            key = file_hash(content)
+            files[os.path.relpath(path, directory)] = key
+            if key not in index["entries"]:
+                contents[key] = content
+
+    if contents:
+        keys = list(contents)
+        if jobs == 1 or len(keys) == 1:
+            results = [process_mod(contents[key], simplify, fast, celsius) for key in keys]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(process_mod, [contents[key] for key in keys],
+                    [simplify]*len(keys), [fast]*len(keys), [celsius]*len(keys)))
+        index["entries"].update(zip(keys, results))
+
+    # Forget results for files that no longer exist
+    used = set(files.values())
+    index["entries"] = {key: value for key, value in index["entries"].items() if key in used}
+    index["files"] = files
+    save_json(index, index_path)
+
+    return {path: index["entries"][key] for path, key in files.items()}
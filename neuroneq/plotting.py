@@ -0,0 +1,362 @@
+"""
+Computation and drawing for the x_alpha/x_beta to x_inf/x_tau figures
+
+The compute_* functions do the numeric and symbolic work and return plain
+dicts, so they can run off the Tk thread. The draw_* functions only touch
+matplotlib axes and work with any backend. Curves are drawn from a min/max
+decimated copy (see downsample) that follows the visible x range, so grids
+of millions of points still render quickly while fits use every sample.
+"""
+
+import hashlib
+
+import numpy as np
+
+from . import cache
+from .expressions import compile_expression, normalize, inf_expression as build_inf_expression, tau_expression as build_tau_expression
+from .fitting import inf_func, fit_inf_popt
+from .sampling import adaptive_grid, evaluate_limit
+from .temperature import q10_sweep
+from .utils import ab2inf_tau
+
+DEFAULT_POINTS = 2000
+OVERLAY_POINTS = 500
+OVERLAY_COLORMAP = "tab20"
+
+
+def compute_curves(alpha:str, beta:str, min_v, max_v, points:int=DEFAULT_POINTS, tol:float=None) -> dict:
+    """
+    Evaluates alpha, beta, inf and tau over the voltage range, on a
+    uniform grid of points or, when tol is given, on an adaptive grid
+    that resolves all four curves to that tolerance
+    """
+    inf_expression = build_inf_expression(alpha, beta)
+    tau_expression = build_tau_expression(alpha, beta)
+    funcs = [compile_expression(e) for e in (alpha, beta, inf_expression, tau_expression)]
+
+    def curves(v):
+        return np.vstack([func(v) for func in funcs])
+
+    if tol:
+        v, y = adaptive_grid(curves, min_v, max_v, tol=tol)
+    else:
+        v = np.linspace(float(min_v),float(max_v),points)
+        y = evaluate_limit(curves, v)
+    return {
+        "alpha_expression": alpha,
+        "beta_expression": beta,
+        "inf_expression": inf_expression,
+        "tau_expression": tau_expression,
+        "v": v,
+        "alpha": y[0],
+        "beta": y[1],
+        "inf": y[2],
+        "tau": y[3],
+    }
+
+
+def compute_symbolic(alpha:str, beta:str, timeout:float=None) -> tuple:
+    """
+    Simplified (inf, tau) equations, each limited to timeout seconds
+    """
+    return ab2inf_tau(alpha, beta, timeout=timeout)
+
+
+def compute_fit(v, inf_y, fast:bool=True, expression:str=None) -> dict:
+    """
+    Fits the x_inf curve to the standard form. With the expression that
+    produced inf_y the result is kept in the persistent cache, keyed on
+    the sample voltages themselves since adaptive grids differ by tol
+    """
+    if expression is None:
+        popt, resid = fit_inf_popt(v, inf_y, fast=fast)
+    else:
+        def fit():
+            popt, resid = fit_inf_popt(v, inf_y, fast=fast)
+            return [float(p) for p in popt], float(resid)
+        grid = hashlib.sha256(np.ascontiguousarray(v, dtype=float).tobytes()).hexdigest()
+        key = cache.make_key("compute_fit", normalize(expression), grid, fast)
+        popt, resid = cache.cached(key, fit)
+        popt = np.array(popt)
+
+    inf_func_vh = round(popt[0],2)
+    inf_func_tau = round(popt[1],2)
+    return {
+        "popt": popt,
+        "resid": resid,
+        "y": inf_func(v, *popt),
+        "inf_func_str": "1.0/(1.0+(exp((v+" + str(inf_func_vh) + ")/("+ str(inf_func_tau)+"))))",
+        "vhalf": -inf_func_vh,
+        "k": -round(1.0/float(popt[1]),4),
+    }
+
+
+def downsample(x, y, points:int, xlim:tuple=None) -> tuple:
+    """
+    Min/max decimation for display. The samples inside xlim (plus one
+    either side) are split into points/2 equal width bins and only the
+    lowest and highest sample of each bin are kept, in order, so peaks and
+    steep edges survive. x must be increasing
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if xlim is not None:
+        lo = max(np.searchsorted(x, min(xlim), side="left") - 1, 0)
+        hi = min(np.searchsorted(x, max(xlim), side="right") + 1, x.shape[0])
+        x, y = x[lo:hi], y[lo:hi]
+    n = x.shape[0]
+    if n <= points or n < 2:
+        return x, y
+
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], max(points//2, 1) + 1)[1:-1])
+    starts = np.unique(np.concatenate([[0], edges]))
+    starts = starts[starts < n]
+    segment = np.repeat(np.arange(starts.shape[0]), np.diff(np.append(starts, n)))
+
+    keep = [[0, n - 1]]
+    nan = np.isnan(y)
+    for values, reduce in ((np.where(nan, np.inf, y), np.minimum), (np.where(nan, -np.inf, y), np.maximum)):
+        extreme = reduce.reduceat(values, starts)
+        hits = np.flatnonzero(values == extreme[segment])
+        keep.append(hits[np.unique(segment[hits], return_index=True)[1]])
+    keep = np.unique(np.concatenate(keep))
+    return x[keep], y[keep]
+
+
+def plot_downsampled(ax, x, y, *args, points:int=None, **kwargs):
+    """
+    ax.plot for curves with more samples than the axes has pixels. The
+    line shows a downsampled copy (two samples per pixel column by
+    default) that is recomputed for the visible range whenever the x
+    limits change, eg when zooming with the navigation toolbar
+    """
+    if points is None:
+        points = max(2*int(ax.bbox.width), 200)
+    line, = ax.plot(*downsample(x, y, points), *args, **kwargs)
+    if np.shape(x)[0] > points:
+        def update(ax):
+            line.set_data(*downsample(x, y, points, ax.get_xlim()))
+        # ax.clear() drops the callback with the line
+        ax.callbacks.connect("xlim_changed", update)
+    return line
+
+
+def draw_rates(ax, curves:dict):
+    ax.clear()
+    ax.title.set_text('x_alpha/x_beta')
+    plot_downsampled(ax,curves["v"],curves["alpha"],label='Alpha')
+    plot_downsampled(ax,curves["v"],curves["beta"],label='Beta')
+    ax.legend()
+
+
+def draw_inf(ax, curves:dict):
+    ax.clear()
+    ax.title.set_text('x_inf')
+    plot_downsampled(ax,curves["v"],curves["inf"])
+
+
+def draw_tau(ax, curves:dict):
+    ax.clear()
+    ax.title.set_text('x_tau')
+    plot_downsampled(ax,curves["v"],curves["tau"])
+
+
+def draw_regression(ax, curves:dict, fit:dict=None):
+    ax.clear()
+    ax.title.set_text('x_inf regression')
+    plot_downsampled(ax,curves["v"],curves["inf"],label="original")
+    if fit is not None:
+        plot_downsampled(ax,curves["v"],fit["y"],'r-',label="fit")
+        ax.legend()
+
+
+def compute_q10_sweep(alpha:str, beta:str, min_v, max_v, min_celsius, max_celsius, q10_alpha, q10_beta,
+                      base_celsius, points:int=500, temperatures:int=50) -> dict:
+    """
+    inf/tau surfaces over voltage and temperature with per-temperature
+    Boltzmann fits of inf
+    """
+    v = np.linspace(float(min_v),float(max_v),points)
+    celsius = np.linspace(float(min_celsius),float(max_celsius),temperatures)
+    return q10_sweep(alpha, beta, v, celsius, q10=(float(q10_alpha), float(q10_beta)),
+        base_celsius=float(base_celsius), fit=True)
+
+
+def draw_q10_sweep(figure, sweep:dict):
+    """
+    Heatmaps of inf and tau over voltage (x) and temperature (y),
+    with the fitted V1/2 of inf at each temperature overlaid
+    """
+    figure.clear()
+    extent = (sweep["v"][0], sweep["v"][-1], sweep["celsius"][0], sweep["celsius"][-1])
+    for i, (name, title) in enumerate((("inf", "x_inf"), ("tau", "x_tau"))):
+        ax = figure.add_subplot(1, 2, i + 1)
+        image = ax.imshow(sweep[name], origin="lower", aspect="auto", extent=extent)
+        figure.colorbar(image, ax=ax)
+        ax.title.set_text(title + " vs temperature")
+        ax.set_xlabel("v")
+        ax.set_ylabel("celsius")
+        if name == "inf" and "fit_vh" in sweep:
+            ax.plot(-sweep["fit_vh"], sweep["celsius"], 'w--', linewidth=1)
+            ax.set_xlim(extent[0], extent[1])
+
+
+def compute_overlay(channels, min_v, max_v, points:int=OVERLAY_POINTS) -> dict:
+    """
+    Evaluates a set of channels (dicts from batch.read_channels, with
+    alpha/beta or inf/tau) on one voltage grid. Returns (channels x points)
+    arrays of alpha, beta, inf and tau plus the channel names; channels
+    that fail to evaluate are listed in errors instead
+    """
+    v = np.linspace(float(min_v),float(max_v),points)
+    names, rows, errors = [], [], []
+    for i, channel in enumerate(channels):
+        name = str(channel.get("name", i))
+        if "error" in channel:
+            errors.append(name + ": " + channel["error"])
+            continue
+        try:
+            if "alpha" in channel or "beta" in channel:
+                alpha, beta = str(channel["alpha"]), str(channel["beta"])
+                funcs = [compile_expression(e) for e in (alpha, beta, build_inf_expression(alpha, beta), build_tau_expression(alpha, beta))]
+                rows.append(evaluate_limit(lambda x: np.vstack([func(x) for func in funcs]), v))
+            else:
+                funcs = [compile_expression(str(channel[key])) for key in ("inf", "tau")]
+                inf_y, tau_y = evaluate_limit(lambda x: np.vstack([func(x) for func in funcs]), v)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    rows.append(np.vstack([inf_y/tau_y, (1.0 - inf_y)/tau_y, inf_y, tau_y]))
+            names.append(name)
+        except Exception as e:
+            errors.append(name + ": " + str(e))
+
+    y = np.array(rows).reshape(len(rows), 4, points)
+    return {
+        "v": v,
+        "names": names,
+        "alpha": y[:, 0],
+        "beta": y[:, 1],
+        "inf": y[:, 2],
+        "tau": y[:, 3],
+        "errors": errors,
+    }
+
+
+def _segments(v, y):
+    return np.stack([np.broadcast_to(v, y.shape), y], axis=-1)
+
+
+def arrow_segments(start, direction, length:float, head_ratio:float=0.3, head_angle:float=15) -> list:
+    """
+    Segments of a 3D arrow from start pointing along direction, drawn
+    like Axes3D.quiver(normalize=True): a shaft of the given length and
+    two head lines. Returns no segments when the arrow has no direction
+    """
+    start, direction = np.asarray(start, dtype=float), np.asarray(direction, dtype=float)
+    norm = np.linalg.norm(direction)
+    if not norm or not np.isfinite(norm) or not np.isfinite(length):
+        return []
+    direction = direction/norm
+    tip = start + length*direction
+    side = np.cross(direction, [0, 0, 1] if abs(direction[2]) < 0.9 else [1, 0, 0])
+    side /= np.linalg.norm(side)
+    angle = np.radians(head_angle)
+    back = head_ratio*length*np.cos(angle)*direction
+    across = head_ratio*length*np.sin(angle)*side
+    return [[start, tip], [tip, tip - back + across], [tip, tip - back - across]]
+
+
+def draw_overlay(axes:dict, overlay:dict) -> dict:
+    """
+    Adds the overlay curves to the four parameter axes as one
+    LineCollection per axis (alpha solid and beta dashed on the rates axis).
+    Returns the collections, to be restyled with style_overlay
+    """
+    from matplotlib.collections import LineCollection
+
+    v = overlay["v"]
+    count = len(overlay["names"])
+    data = {
+        "rates": (np.concatenate([overlay["alpha"], overlay["beta"]]), ["solid"]*count + ["dashed"]*count),
+        "inf": (overlay["inf"], "solid"),
+        "tau": (overlay["tau"], "solid"),
+        "regression": (overlay["inf"], "solid"),
+    }
+    collections = {}
+    for key, (y, linestyles) in data.items():
+        ax = axes[key]
+        collection = LineCollection(_segments(v, y), linestyles=linestyles, linewidths=1, zorder=1)
+        ax.add_collection(collection, autolim=True)
+        ax.autoscale_view()
+        collections[key] = collection
+    style_overlay(collections, count)
+    return collections
+
+
+def style_overlay(collections:dict, count:int, hidden=(), highlight=()):
+    """
+    Sets per-curve colors and widths: hidden curves are made transparent,
+    highlighted ones are drawn thicker over the others, which are dimmed.
+    Only the collection properties change, redraw them with a BlitManager
+    """
+    from matplotlib import colormaps
+
+    colors = colormaps[OVERLAY_COLORMAP](np.arange(count) % colormaps[OVERLAY_COLORMAP].N)
+    widths = np.ones(count)
+    colors[:, 3] = 0.25 if len(highlight) else 0.8
+    highlight = [i for i in highlight if i < count]
+    colors[highlight, 3] = 1.0
+    widths[highlight] = 2.5
+    colors[[i for i in hidden if i < count], 3] = 0.0
+
+    for key, collection in collections.items():
+        repeat = len(collection.get_segments())//max(count, 1)
+        collection.set_color(np.tile(colors, (repeat, 1)))
+        collection.set_linewidth(np.tile(widths, repeat))
+
+
+class BlitManager():
+    """
+    Redraws a few animated artists without rendering the rest of the
+    figure again. The background is captured after every full draw, later
+    updates restore it, draw only the artists over it and blit
+    """
+
+    def __init__(self, canvas, artists=()):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.draw_cid = canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            # Artists removed by ax.clear() are skipped
+            if artist.axes is not None:
+                self.canvas.figure.draw_artist(artist)
+
+    def update(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self.draw_cid)
+
+
+def draw_parameters(axes:dict, curves:dict, fit:dict=None):
+    """
+    Draws all four panels, axes is a dict with the keys
+    rates, inf, tau and regression
+    """
+    draw_rates(axes["rates"], curves)
+    draw_inf(axes["inf"], curves)
+    draw_tau(axes["tau"], curves)
+    draw_regression(axes["regression"], curves, fit)
@@ -0,0 +1,122 @@
+"""
+Lightweight timing instrumentation
+
+Each stage (expression parse/eval, sympy.simplify, curve_fit, canvas draw,
+...) keeps a call count, total/min/max/last time and a histogram over
+decade buckets. Stats are process wide, read with stats() and written as
+JSON with dump(); the CLI does this with --profile.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper edges in seconds, the last bucket is open ended
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _new_stage() -> dict:
+    return {"count": 0, "total_s": 0.0, "min_s": None, "max_s": 0.0, "last_s": 0.0, "histogram": [0]*(len(BUCKETS) + 1)}
+
+
+def record(stage:str, elapsed:float):
+    """
+    Adds one timing for stage
+    """
+    bucket = len(BUCKETS)
+    for i, edge in enumerate(BUCKETS):
+        if elapsed <= edge:
+            bucket = i
+            break
+    with _lock:
+        entry = _stats.get(stage)
+        if entry is None:
+            entry = _stats[stage] = _new_stage()
+        entry["count"] += 1
+        entry["total_s"] += elapsed
+        entry["min_s"] = elapsed if entry["min_s"] is None else min(entry["min_s"], elapsed)
+        entry["max_s"] = max(entry["max_s"], elapsed)
+        entry["last_s"] = elapsed
+        entry["histogram"][bucket] += 1
+
+
+@contextmanager
+def timed(stage:str):
+    """
+    Context manager timing the enclosed block as stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def merge(other:dict):
+    """
+    Adds stats collected elsewhere (eg in a worker process)
+    """
+    with _lock:
+        for stage, theirs in other.items():
+            entry = _stats.get(stage)
+            if entry is None:
+                entry = _stats[stage] = _new_stage()
+            entry["count"] += theirs["count"]
+            entry["total_s"] += theirs["total_s"]
+            if theirs["min_s"] is not None:
+                entry["min_s"] = theirs["min_s"] if entry["min_s"] is None else min(entry["min_s"], theirs["min_s"])
+            entry["max_s"] = max(entry["max_s"], theirs["max_s"])
+            entry["last_s"] = theirs["last_s"]
+            entry["histogram"] = [a + b for a, b in zip(entry["histogram"], theirs["histogram"])]
+
+
+def stats() -> dict:
+    """
+    Copy of the stats for every stage
+    """
+    with _lock:
+        return {stage: dict(entry, histogram=list(entry["histogram"])) for stage, entry in _stats.items()}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def totals() -> dict:
+    """
+    {stage: total_s}, used with summary(since=...) to time a single action
+    """
+    with _lock:
+        return {stage: entry["total_s"] for stage, entry in _stats.items()}
+
+
+def _format_time(seconds:float) -> str:
+    if seconds >= 1.0:
+        return "{:.2f} s".format(seconds)
+    return "{:.1f} ms".format(seconds*1000)
+
+
+def summary(since:dict=None) -> str:
+    """
+    One line of per-stage times, eg "sympy.simplify 1.20 s, draw 80.0 ms".
+    With since (from totals()) only the time spent after it is shown
+    """
+    since = since or {}
+    spent = [(stage, total - since.get(stage, 0.0)) for stage, total in totals().items()]
+    spent = sorted((item for item in spent if item[1] > 0), key=lambda item: -item[1])
+    return ", ".join(stage + " " + _format_time(seconds) for stage, seconds in spent)
+
+
+def dump(stream=None) -> str:
+    """
+    Writes the stats as JSON to stream (if given) and returns them
+    """
+    text = json.dumps({"buckets_s": list(BUCKETS), "stages": stats()}, indent=1)
+    if stream is not None:
+        stream.write(text + "\n")
+    return text
@@ -0,0 +1,197 @@
+"""
+Headless report rendering for channel libraries
+
+Renders the four panel figure of the parameters page (alpha/beta, x_inf,
+x_tau and the x_inf regression) for every channel in a list with the Agg
+backend, spread over a process pool. Figures are written as PNG and/or PDF
+next to an index.html summary. A manifest records a hash of each
+channel's inputs, so channels that haven't changed are not rendered again.
+"""
+
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import profiling
+from .batch import DEFAULT_MAX_V, DEFAULT_MIN_V
+from .workers import load_json, profiled, save_json, write_text
+
+MANIFEST_FILE = "report.json"
+INDEX_PAGE = "index.html"
+# Bump when the figure layout changes so existing reports are redrawn
+REPORT_VERSION = 1
+FORMATS = ("png", "pdf")
+
+
+def channel_hash(channel:dict, options:dict) -> str:
+    """
+    Hash of everything that affects a channel's figure
+    """
+    inputs = {key: str(channel[key]) for key in ("name", "alpha", "beta", "inf", "tau", "min_v", "max_v") if key in channel}
+    text = json.dumps([REPORT_VERSION, inputs, options], sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _slugs(channels:list) -> list:
+    """
+    File names for the channels, from their names (or positions) and
+    unique within the report
+    """
+    slugs, seen = [], {}
+    for channel in channels:
+        name = str(channel.get("name", "channel_" + str(channel["index"])))
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_.") or "channel"
+        seen[slug] = seen.get(slug, 0) + 1
+        slugs.append(slug if seen[slug] == 1 else slug + "_" + str(seen[slug]))
+    return slugs
+
+
+def _rates(channel:dict) -> tuple:
+    """
+    alpha/beta of a channel, derived from inf/tau when those are given
+    """
+    if "alpha" in channel or "beta" in channel:
+        return str(channel["alpha"]), str(channel["beta"])
+    inf, tau = str(channel["inf"]), str(channel["tau"])
+    return "(" + inf + ")/(" + tau + ")", "(1-(" + inf + "))/(" + tau + ")"
+
+
+def render_channel(channel:dict, directory:str, formats=("png",), simplify:bool=True, fast:bool=True) -> dict:
+    """
+    Renders one channel's figure into directory as <slug>.<format> and
+    returns its summary. Errors are reported in the result instead of raised
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from .plotting import compute_curves, compute_fit, draw_parameters
+    from .utils import ab2inf_tau
+
+    slug = channel["slug"]
+    result = {"index": channel["index"], "name": str(channel.get("name", channel["index"])), "slug": slug}
+    if "error" in channel:
+        result["error"] = channel["error"]
+        return result
+    try:
+        min_v = float(channel.get("min_v", DEFAULT_MIN_V))
+        max_v = float(channel.get("max_v", DEFAULT_MAX_V))
+        alpha, beta = _rates(channel)
+
+        with profiling.timed("report.compute"):
+            curves = compute_curves(alpha, beta, min_v, max_v)
+            fit = compute_fit(curves["v"], curves["inf"], fast=fast, expression=curves["inf_expression"])
+            inf, tau = ab2inf_tau(alpha, beta, simplify=simplify)
+
+        with profiling.timed("report.render"):
+            figure = Figure(figsize=(8,4), dpi=100)
+            FigureCanvasAgg(figure)
+            axes = {key: figure.add_subplot(2, 2, i + 1) for i, key in enumerate(("rates", "inf", "tau", "regression"))}
+            draw_parameters(axes, curves, fit)
+            figure.suptitle(result["name"])
+            figure.tight_layout()
+            files = []
+            for extension in formats:
+                filename = slug + "." + extension
+                figure.savefig(os.path.join(directory, filename))
+                files.append(filename)
+
+        result.update({
+            "files": files,
+            "inf": inf,
+            "tau": tau,
+            "fit_inf": fit["inf_func_str"],
+            "vhalf": float(fit["vhalf"]),
+            "k": float(fit["k"]),
+            "resid": float(fit["resid"]),
+        })
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def write_index(results:list, path:str):
+    """
+    Writes an HTML page with a row per channel: figure, equations and fit
+    """
+    rows = []
+    for result in results:
+        name = html.escape(result["name"])
+        if "error" in result:
+            rows.append("<tr><td>{}</td><td colspan=\"2\" class=\"error\">{}</td></tr>".format(name, html.escape(result["error"])))
+            continue
+        links = " ".join("<a href=\"{0}\">{1}</a>".format(html.escape(f), f.rsplit(".", 1)[-1].upper()) for f in result["files"])
+        png = [f for f in result["files"] if f.endswith(".png")]
+        image = "<a href=\"{0}\"><img src=\"{0}\" width=\"400\"></a>".format(html.escape(png[0])) if png else ""
+        details = "<br>".join([
+            "x_inf = <code>" + html.escape(result["inf"]) + "</code>",
+            "x_tau = <code>" + html.escape(result["tau"]) + "</code>",
+            "fit = <code>" + html.escape(result["fit_inf"]) + "</code>",
+            "V1/2 = {:.2f}, k = {:.4f}, residual = {:.3g}".format(result["vhalf"], result["k"], result["resid"]),
+            links,
+        ])
+        rows.append("<tr><td>{}</td><td>{}</td><td>{}</td></tr>".format(name, image, details))
+
+    page = "\n".join([
+        "<!DOCTYPE html>",
+        "<html><head><meta charset=\"utf-8\"><title>NeuronEQ report</title>",
+        "<style>body{font-family:sans-serif} td{vertical-align:top;padding:4px;border-bottom:1px solid #ccc} .error{color:#b00}</style>",
+        "</head><body>",
+        "<h1>NeuronEQ report</h1>",
+        "<p>{} channels, {} errors</p>".format(len(results), sum("error" in result for result in results)),
+        "<table><tr><th>Channel</th><th>Figure</th><th>Equations</th></tr>",
+    ] + rows + ["</table></body></html>", ""])
+    write_text(page, path)
+
+
+def render_report(channels, directory:str, jobs:int=None, formats=("png",), simplify:bool=True, fast:bool=True) -> list:
+    """
+    Renders every channel into directory and writes index.html. Channels
+    whose inputs match the manifest and whose files still exist are
+    reused. Returns the results in input order, each with "cached" set
+    when it wasn't rendered again
+    """
+    formats = tuple(formats)
+    for extension in formats:
+        if extension not in FORMATS:
+            raise ValueError("Unknown report format: " + str(extension))
+    os.makedirs(directory, exist_ok=True)
+    options = {"formats": list(formats), "simplify": simplify, "fast": fast}
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    manifest = load_json(manifest_path, REPORT_VERSION, options, {"channels": {}})
+
+    channels = [{**channel, "index": index} for index, channel in enumerate(channels)]
+    for channel, slug in zip(channels, _slugs(channels)):
+        channel["slug"] = slug
+    results = [None]*len(channels)
+    hashes = {}
+    todo = []
+    for channel in channels:
+        slug = channel["slug"]
+        hashes[slug] = channel_hash(channel, options)
+        entry = manifest["channels"].get(slug)
+        if (entry is not None and entry["hash"] == hashes[slug]
+                and all(os.path.exists(os.path.join(directory, f)) for f in entry["result"].get("files", []))):
+            results[channel["index"]] = dict(entry["result"], index=channel["index"], cached=True)
+        else:
+            todo.append(channel)
+
+    if jobs == 1 or len(todo) <= 1:
+        for channel in todo:
+            results[channel["index"]] = render_channel(channel, directory, formats, simplify, fast)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(profiled, render_channel, channel, directory, formats, simplify, fast) for channel in todo]
+            for future in as_completed(futures):
+                result, stats = future.result()
+                profiling.merge(stats)
+                results[result["index"]] = result
+
+    manifest["channels"] = {
+        result["slug"]: {"hash": hashes[result["slug"]], "result": {key: value for key, value in result.items() if key != "cached"}}
+        for result in results if "error" not in result
+    }
+    save_json(manifest, manifest_path)
+    write_index(results, os.path.join(directory, INDEX_PAGE))
+    return results
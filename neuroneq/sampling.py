@@ -0,0 +1,97 @@
+"""
+Adaptive voltage sampling
+
+Instead of a fixed np.linspace(min_v, max_v, 2000), intervals are bisected
+only where linear interpolation between their end points misses the curve
+by more than a tolerance, so flat regions get few points and sharp
+transitions get many. Removable singularities such as
+(v+45)/(1-exp(-(v+45)/10)) at v=-45 are evaluated as limits instead of NaN.
+"""
+
+import numpy as np
+
+DEFAULT_TOL = 1e-3
+INITIAL_POINTS = 33
+MAX_POINTS = 20000
+
+
+def fill_nonfinite(y):
+    """
+    Replaces nan/inf samples along the last axis by interpolating between
+    their finite neighbours (in place, returns y)
+    """
+    for row in np.reshape(y, (-1, np.shape(y)[-1])):
+        bad = ~np.isfinite(row)
+        if bad.any() and not bad.all():
+            index = np.arange(row.shape[0])
+            row[bad] = np.interp(index[bad], index[~bad], row[~bad])
+    return y
+
+
+def evaluate_limit(func, v):
+    """
+    Evaluates func at v. Samples that come out nan/inf (eg 0/0) are
+    replaced by the average of func just either side of them when that is
+    finite, which is the limit at a removable singularity
+    """
+    v = np.asarray(v, dtype=float)
+    with np.errstate(all="ignore"):
+        y = np.array(func(v), dtype=float)
+        bad = ~np.isfinite(y)
+        if bad.any():
+            columns = np.nonzero(bad.reshape(-1, v.shape[0]).any(axis=0))[0]
+            eps = 1e-6*np.maximum(1.0, np.abs(v[columns]))
+            below = np.asarray(func(v[columns] - eps), dtype=float)
+            above = np.asarray(func(v[columns] + eps), dtype=float)
+            limit = 0.5*(below + above)
+            y[..., columns] = np.where(np.isfinite(y[..., columns]), y[..., columns], limit)
+    return y
+
+
+def adaptive_grid(func, min_v, max_v, tol:float=DEFAULT_TOL, initial:int=INITIAL_POINTS, max_points:int=MAX_POINTS, min_dv:float=None) -> tuple:
+    """
+    Samples func over [min_v, max_v], returns (v, y).
+    func may return one curve or several stacked along the first axis,
+    in which case the grid is refined until every curve is resolved.
+    An interval is bisected while the curve at its midpoint differs from
+    the linear interpolation by more than tol times the curve's range
+    """
+    min_v, max_v = float(min_v), float(max_v)
+    if min_dv is None:
+        min_dv = (max_v - min_v)*1e-7
+    v = np.linspace(min_v, max_v, initial)
+    y = evaluate_limit(func, v)
+
+    while v.shape[0] < max_points:
+        finite = np.where(np.isfinite(y), y, np.nan)
+        with np.errstate(invalid="ignore"):
+            scale = np.nanmax(finite, axis=-1) - np.nanmin(finite, axis=-1)
+        scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+        width = np.diff(v)
+        candidates = np.nonzero(width > 2*min_dv)[0]
+        if candidates.size == 0:
+            break
+        mid = 0.5*(v[candidates] + v[candidates + 1])
+        y_mid = evaluate_limit(func, mid)
+        linear = 0.5*(y[..., candidates] + y[..., candidates + 1])
+        with np.errstate(invalid="ignore"):
+            error = np.abs(y_mid - linear)/np.expand_dims(scale, -1)
+        error = np.where(np.isfinite(error), error, np.inf)
+        refine = np.reshape(error > tol, (-1, candidates.size)).any(axis=0)
+        if not refine.any():
+            break
+
+        # Refine the worst intervals first when the point budget runs out
+        budget = max_points - v.shape[0]
+        if refine.sum() > budget:
+            worst = np.reshape(error, (-1, candidates.size)).max(axis=0)
+            keep = np.argsort(-np.where(refine, worst, -np.inf))[:budget]
+            refine = np.zeros_like(refine)
+            refine[keep] = True
+
+        positions = candidates[refine] + 1
+        v = np.insert(v, positions, mid[refine])
+        y = np.insert(y, positions, y_mid[..., refine], axis=-1)
+
+    return v, y
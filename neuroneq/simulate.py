@@ -0,0 +1,147 @@
+"""
+Voltage-clamp simulation of gating variables
+
+Integrates dx/dt = (x_inf(v) - x)/x_tau(v) with exponential Euler,
+x(t+dt) = x_inf + (x(t) - x_inf)*exp(-dt/x_tau), which is exact while the
+clamp voltage is constant. Clamp protocols are piecewise constant, so
+x_inf and exp(-dt/x_tau) are evaluated once per distinct voltage, each
+constant segment is integrated in one array operation, and every gate,
+protocol and sweep step is advanced together.
+"""
+
+import numpy as np
+
+from .expressions import compile_expression
+from .profiling import timed
+from .sampling import evaluate_limit, fill_nonfinite
+from .utils import ab2inf_tau
+
+DEFAULT_DT = 0.025
+
+
+def step_protocol(holding:float, steps, hold_duration:float=50, step_duration:float=100, tail:float=None,
+                  tail_duration:float=0, dt:float=DEFAULT_DT) -> tuple:
+    """
+    Clamp commands stepping from holding to each voltage in steps, then
+    optionally to tail. Returns (t, v) with v shaped (len(steps), len(t))
+    """
+    steps = np.atleast_1d(np.asarray(steps, dtype=float))
+    n_hold = int(round(hold_duration/dt))
+    n_step = int(round(step_duration/dt))
+    n_tail = int(round(tail_duration/dt)) if tail is not None else 0
+    v = np.empty((steps.shape[0], n_hold + n_step + n_tail + 1))
+    v[:, :n_hold + 1] = holding
+    v[:, n_hold + 1:n_hold + n_step + 1] = steps[:, None]
+    if n_tail:
+        v[:, n_hold + n_step + 1:] = tail
+    return dt*np.arange(v.shape[1]), v
+
+
+def simulate(inf, tau, v, dt:float=DEFAULT_DT, x0=None):
+    """
+    Integrates gating variables under the clamp commands v (time along the
+    last axis). inf and tau are expressions in v, or equal length lists of
+    them for several gates. x0 defaults to steady state at the first
+    command voltage. Returns traces shaped like v, with a leading gate
+    axis when lists were given
+    """
+    single = isinstance(inf, str)
+    infs = [inf] if single else list(inf)
+    taus = [tau] if single else list(tau)
+    if len(infs) != len(taus):
+        raise ValueError("inf and tau need the same number of expressions")
+
+    v = np.asarray(v, dtype=float)
+    with timed("simulate"):
+        # Distinct clamp voltages, every time step indexes into these
+        levels, index = np.unique(v, return_inverse=True)
+        index = index.reshape(v.shape)
+        inf_levels = np.vstack([fill_nonfinite(evaluate_limit(compile_expression(e), levels)) for e in infs])
+        tau_levels = np.vstack([fill_nonfinite(evaluate_limit(compile_expression(e), levels)) for e in taus])
+        with np.errstate(divide="ignore"):
+            log_decay_levels = -dt/tau_levels
+
+        traces = np.empty((len(infs),) + v.shape)
+        if x0 is None:
+            traces[..., 0] = inf_levels[:, index[..., 0]]
+        else:
+            traces[..., 0] = x0
+        # Within a run of steps where no command changes, k exponential
+        # Euler steps collapse to x_inf + (x - x_inf)*decay**k
+        changed = (np.diff(v, axis=-1) != 0).reshape(-1, max(v.shape[-1] - 1, 1)).any(axis=0)
+        starts = np.concatenate([[1], np.nonzero(changed[1:])[0] + 2])
+        ends = np.concatenate([starts[1:], [v.shape[-1]]])
+        for start, end in zip(starts, ends):
+            if start >= end:
+                continue
+            level = index[..., start]
+            x_inf = inf_levels[:, level][..., None]
+            segment = traces[..., start:end]
+            np.multiply(log_decay_levels[:, level][..., None], np.arange(1, end - start + 1), out=segment)
+            np.exp(segment, out=segment)
+            segment *= traces[..., start - 1, None] - x_inf
+            segment += x_inf
+
+    return traces[0] if single else traces
+
+
+def simulate_rates(alpha, beta, v, dt:float=DEFAULT_DT, x0=None):
+    """
+    simulate for alpha/beta pairs, converted with ab2inf_tau
+    """
+    if isinstance(alpha, str):
+        inf, tau = ab2inf_tau(alpha, beta, simplify=False)
+    else:
+        inf, tau = zip(*[ab2inf_tau(a, b, simplify=False) for a, b in zip(alpha, beta)])
+    return simulate(inf, tau, v, dt, x0)
+
+
+def activation(inf, tau, steps=None, holding:float=-100, hold_duration:float=50, step_duration:float=100,
+               dt:float=DEFAULT_DT) -> dict:
+    """
+    Activation protocol: steps from holding to each test voltage.
+    Returns the traces, the value at the end of every step and the
+    analytic steady state x_inf at the test voltages
+    """
+    if steps is None:
+        steps = np.arange(-100, 51, 5)
+    t, v = step_protocol(holding, steps, hold_duration, step_duration, dt=dt)
+    traces = simulate(inf, tau, v, dt)
+    steps = np.atleast_1d(np.asarray(steps, dtype=float))
+    return {
+        "t": t,
+        "v": v,
+        "steps": steps,
+        "traces": traces,
+        "steady_state": traces[..., -1],
+        "inf": _steady_state(inf, steps),
+    }
+
+
+def inactivation(inf, tau, prepulses=None, test:float=0, holding:float=-100, hold_duration:float=50,
+                 prepulse_duration:float=500, test_duration:float=50, dt:float=DEFAULT_DT) -> dict:
+    """
+    Inactivation protocol: a long prepulse to each voltage followed by a
+    step to test. Returns the traces, the value at the start of the test
+    pulse and the analytic steady state x_inf at the prepulse voltages
+    """
+    if prepulses is None:
+        prepulses = np.arange(-120, 21, 5)
+    t, v = step_protocol(holding, prepulses, hold_duration, prepulse_duration, test, test_duration, dt=dt)
+    traces = simulate(inf, tau, v, dt)
+    prepulses = np.atleast_1d(np.asarray(prepulses, dtype=float))
+    end = int(round(hold_duration/dt)) + int(round(prepulse_duration/dt))
+    return {
+        "t": t,
+        "v": v,
+        "steps": prepulses,
+        "traces": traces,
+        "steady_state": traces[..., end],
+        "inf": _steady_state(inf, prepulses),
+    }
+
+
+def _steady_state(inf, v):
+    if isinstance(inf, str):
+        return evaluate_limit(compile_expression(inf), v)
+    return np.vstack([evaluate_limit(compile_expression(e), v) for e in inf])
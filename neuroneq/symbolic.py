@@ -0,0 +1,309 @@
+"""
+Time-bounded symbolic simplification
+
+sympy.simplify has no upper bound on its run time, so simplification runs
+in a worker process under a wall-clock budget. The worker climbs a ladder
+of strategies from cheap to expensive (together/cancel, then factor, then
+full simplify) and reports every improvement as it goes; when the budget
+runs out the worker is killed and the best expression so far is returned.
+The budget starts once the worker has imported sympy.
+Expressions that come back early are just less simplified, they still
+evaluate to the same values.
+
+NEURONEQ_SIMPLIFY_TIMEOUT sets the default budget in seconds.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from .profiling import timed
+
+DEFAULT_TIMEOUT = float(os.environ.get("NEURONEQ_SIMPLIFY_TIMEOUT", 10.0))
+STRATEGIES = ("cancel", "factor", "simplify")
+# Time allowed for a new worker to import sympy, not charged to the budget
+STARTUP_TIMEOUT = 60.0
+
+_worker = None
+_lock = threading.Lock()
+
+
+def _ladder(expression:str):
+    """
+    Yields (strategy, expression) for every strategy that improves on the
+    best so far, measured by operation count and then length
+    """
+    import sympy
+    parsed = sympy.sympify(expression)
+    steps = {
+        "cancel": lambda: sympy.cancel(sympy.together(parsed)),
+        "factor": lambda: sympy.factor(parsed),
+        "simplify": lambda: sympy.simplify(parsed),
+    }
+    best = None
+    for name in ("parse",) + STRATEGIES:
+        candidate = parsed if name == "parse" else steps[name]()
+        text = str(candidate)
+        score = (sympy.count_ops(candidate), len(text))
+        if best is None or score < best:
+            best = score
+            yield name, text
+
+
+def _serve(stdin, stdout):
+    """
+    Worker process loop: sends [null, null, null, true] once sympy is
+    imported, then reads one JSON [request, expression] per line and writes
+    [request, strategy, text, done] lines. Errors are sent as
+    [request, null, message, true]
+    """
+    import sympy # noqa: F401, imported before the first request arrives
+    stdout.write(json.dumps([None, None, None, True]) + "\n")
+    stdout.flush()
+    for line in stdin:
+        request, expression = json.loads(line)
+        try:
+            for name, text in _ladder(expression):
+                stdout.write(json.dumps([request, name, text, False]) + "\n")
+                stdout.flush()
+        except Exception as e:
+            stdout.write(json.dumps([request, None, "Could not simplify " + expression + ": " + str(e), True]) + "\n")
+        else:
+            stdout.write(json.dumps([request, None, None, True]) + "\n")
+        stdout.flush()
+
+
+class _Worker():
+    """
+    python -m neuroneq.symbolic in a subprocess, with a thread moving its
+    output into a queue so reads can time out. Requests are numbered and
+    replies to any other request (eg one that timed out) are dropped
+    """
+    def __init__(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        self.process = subprocess.Popen([sys.executable, "-m", "neuroneq.symbolic"], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, env=env, universal_newlines=True, bufsize=1)
+        self.messages = queue.Queue()
+        self.ready = False
+        self.request = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                self.messages.put(json.loads(line))
+            except ValueError:
+                # Stray output from sympy, not part of the protocol
+                pass
+        self.messages.put(None)
+
+    def send(self, expression:str) -> int:
+        self.request += 1
+        self.process.stdin.write(json.dumps([self.request, expression]) + "\n")
+        self.process.stdin.flush()
+        return self.request
+
+    def wait_ready(self) -> bool:
+        """
+        Waits (up to STARTUP_TIMEOUT) for the worker to import sympy
+        """
+        if not self.ready:
+            try:
+                message = self.messages.get(timeout=STARTUP_TIMEOUT)
+            except queue.Empty:
+                return False
+            self.ready = message is not None and message[0] is None
+        return self.ready
+
+    def run(self, expression:str, timeout:float) -> tuple:
+        """
+        Returns (text, strategy, complete) for expression. The timeout
+        starts once the worker has imported sympy; when complete is False
+        the worker is still busy and has to be killed
+        """
+        best, strategy, complete = expression, None, False
+        try:
+            if not self.wait_ready():
+                return best, strategy, complete
+            request = self.send(expression)
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = self.messages.get(timeout=remaining)
+                if message is None:
+                    break
+                reply, name, text, done = message
+                if reply != request:
+                    continue
+                if done:
+                    if text is not None:
+                        raise ValueError(text)
+                    complete = True
+                    break
+                best, strategy = text, name
+        except (queue.Empty, OSError):
+            pass
+        return best, strategy, complete
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def _simplify_inline(expression:str, deadline:float) -> tuple:
+    """
+    Fallback when the worker process can't be started: runs the ladder here
+    and stops after the first strategy that finishes past the deadline
+    """
+    best, strategy, complete = expression, None, True
+    for name, text in _ladder(expression):
+        best, strategy = text, name
+        if time.monotonic() > deadline:
+            complete = False
+            break
+    return best, strategy, complete
+
+
+def simplify(expression:str, timeout:float=None, full_output:bool=False):
+    """
+    Simplifies expression within timeout seconds (DEFAULT_TIMEOUT by
+    default) and returns the best form found. full_output=True returns
+    (text, strategy, complete) where strategy is the ladder step that
+    produced text (None if none finished) and complete tells whether every
+    strategy ran
+    """
+    global _worker
+    timeout = DEFAULT_TIMEOUT if timeout is None else float(timeout)
+
+    with timed("sympy.simplify"), _lock:
+        if _worker is None:
+            try:
+                _worker = _Worker()
+            except OSError:
+                result = _simplify_inline(expression, time.monotonic() + timeout)
+                return result if full_output else result[0]
+
+        best, strategy, complete = _worker.run(expression, timeout)
+        if not complete:
+            _worker.kill()
+            _worker = None
+
+    if full_output:
+        return best, strategy, complete
+    return best
+
+
+def simplify_many(expressions, timeout:float=None, processes:int=None) -> list:
+    """
+    simplify(full_output=True) for every expression, in order, spread over
+    processes worker processes (at most one per core). The shared worker
+    starts on the list right away and the others take expressions once
+    they have imported sympy, so short lists don't wait on their startup.
+    Errors are raised once every expression is done
+    """
+    expressions = list(expressions)
+    results = [None]*len(expressions)
+    todo = queue.Queue()
+    for item in enumerate(expressions):
+        todo.put(item)
+
+    def next_item():
+        try:
+            return todo.get_nowait()
+        except queue.Empty:
+            return None, None
+
+    def drain_shared():
+        i, expression = next_item()
+        while expression is not None:
+            try:
+                results[i] = simplify(expression, timeout, full_output=True)
+            except ValueError as e:
+                results[i] = e
+            i, expression = next_item()
+
+    def drain():
+        worker = None
+        try:
+            while True:
+                if worker is None:
+                    worker = _Worker()
+                    if not worker.wait_ready():
+                        return
+                i, expression = next_item()
+                if expression is None:
+                    return
+                with timed("sympy.simplify"):
+                    try:
+                        results[i] = worker.run(expression, DEFAULT_TIMEOUT if timeout is None else float(timeout))
+                    except ValueError as e:
+                        results[i] = e
+                        continue
+                if not results[i][2]:
+                    worker.kill()
+                    worker = None
+        except OSError:
+            # The shared worker (or its inline fallback) finishes the list
+            pass
+        finally:
+            if worker is not None:
+                worker.kill()
+
+    # More workers than cores only add startup time
+    cores = os.cpu_count() or 1
+    count = min(processes or cores, cores, len(expressions))
+    threads = [threading.Thread(target=drain_shared if i == 0 else drain, daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def _forget_worker():
+    """
+    A forked child shares the parent's pipes to the worker, it starts its
+    own on first use instead
+    """
+    global _worker, _lock
+    _worker = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_worker)
+
+
+def interrupt():
+    """
+    Kills the worker process if a simplification is running, without
+    waiting for it. The interrupted call returns its best form so far
+    """
+    worker = _worker
+    if _lock.locked() and worker is not None:
+        worker.process.kill()
+
+
+def shutdown():
+    """
+    Stops the worker process
+    """
+    global _worker
+    with _lock:
+        if _worker is not None:
+            _worker.kill()
+            _worker = None
+
+
+if __name__ == "__main__":
+    _serve(sys.stdin, sys.stdout)
@@ -0,0 +1,150 @@
+"""
+Precomputed inf/tau lookup tables
+
+Similar to NEURON's TABLE statement: inf and tau are evaluated once over a
+uniform voltage grid (and optionally a temperature grid), saved as .npy
+files that can be memory-mapped, and looked up with linear or cubic
+interpolation instead of evaluating the expressions again.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .expressions import compile_expression
+from .sampling import evaluate_limit, fill_nonfinite
+from .temperature import q10_factor
+from .utils import ab2inf_tau
+
+META_FILE = "table.json"
+INF_FILE = "inf.npy"
+TAU_FILE = "tau.npy"
+
+
+def _interp_uniform(table, x0:float, dx:float, x, kind:str="linear", rows=None):
+    """
+    Interpolates table (sampled at x0 + i*dx along its last axis) at x.
+    With rows (an index array shaped like x) each x is looked up in its own
+    row of a 2D table. Values outside the grid are clamped to the ends
+    """
+    n = table.shape[-1]
+    t = np.clip((np.asarray(x, dtype=float) - x0)/dx, 0, n - 1)
+    i = np.minimum(t.astype(np.intp), n - 2)
+    f = t - i
+
+    def take(index):
+        return table[..., index] if rows is None else table[rows, index]
+
+    if kind == "linear":
+        y0 = take(i)
+        return y0 + (take(i + 1) - y0)*f
+    elif kind == "cubic":
+        # Catmull-Rom spline, end points are repeated at the edges
+        ym = take(np.maximum(i - 1, 0))
+        y0 = take(i)
+        y1 = take(i + 1)
+        y2 = take(np.minimum(i + 2, n - 1))
+        return y0 + 0.5*f*(y1 - ym + f*(2.0*ym - 5.0*y0 + 4.0*y1 - y2 + f*(3.0*(y0 - y1) + y2 - ym)))
+    else:
+        raise ValueError("Unknown interpolation kind: " + str(kind))
+
+
+class GatingTable():
+    """
+    inf/tau lookup table, usually loaded with load_table
+    """
+
+    def __init__(self, inf, tau, min_v:float, dv:float, celsius=None, q10:float=3.0, base_celsius:float=6.3):
+        self.inf_table = inf
+        self.tau_table = tau
+        self.min_v = min_v
+        self.dv = dv
+        self.celsius = None if celsius is None else np.asarray(celsius, dtype=float)
+        self.q10 = q10
+        self.base_celsius = base_celsius
+
+    @property
+    def v(self):
+        return self.min_v + self.dv*np.arange(self.inf_table.shape[-1])
+
+    def inf(self, v, kind:str="linear"):
+        """
+        x_inf at voltages v
+        """
+        return _interp_uniform(self.inf_table, self.min_v, self.dv, v, kind)
+
+    def tau(self, v, celsius=None, kind:str="linear"):
+        """
+        x_tau at voltages v and temperatures celsius, which broadcast
+        against each other. With a temperature grid, the nearest grid
+        temperature at or below celsius is looked up and rescaled by Q10
+        """
+        if self.celsius is None:
+            tau = _interp_uniform(self.tau_table, self.min_v, self.dv, v, kind)
+            if celsius is None:
+                return tau
+            return tau/q10_factor(celsius, self.q10, self.base_celsius)
+
+        if celsius is None:
+            celsius = self.base_celsius
+        v, celsius = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(celsius, dtype=float))
+        j = np.clip(np.searchsorted(self.celsius, celsius, side="right") - 1, 0, len(self.celsius) - 1)
+        tau = _interp_uniform(self.tau_table, self.min_v, self.dv, v, kind, rows=j)
+        scale = q10_factor(self.celsius[j], self.q10, self.base_celsius)/q10_factor(celsius, self.q10, self.base_celsius)
+        return tau*scale
+
+
+def build_table(directory:str, inf:str, tau:str, min_v:float=-100, max_v:float=50, dv:float=0.01,
+                celsius=None, q10:float=3.0, base_celsius:float=6.3) -> GatingTable:
+    """
+    Evaluates inf and tau over a uniform voltage grid with spacing dv and
+    writes them to directory as .npy files. If celsius is a list of
+    temperatures, tau is tabulated at each of them with Q10 scaling
+    (inf is unaffected since alpha and beta scale together)
+    """
+    os.makedirs(directory, exist_ok=True)
+    n = int(round((float(max_v) - float(min_v))/dv)) + 1
+    v = float(min_v) + dv*np.arange(n)
+
+    inf_y = fill_nonfinite(evaluate_limit(compile_expression(inf), v))
+    tau_y = fill_nonfinite(evaluate_limit(compile_expression(tau), v))
+    if celsius is not None:
+        celsius = np.sort(np.atleast_1d(np.asarray(celsius, dtype=float)))
+        tau_y = tau_y[None, :]/q10_factor(celsius, q10, base_celsius)[:, None]
+
+    np.save(os.path.join(directory, INF_FILE), inf_y)
+    np.save(os.path.join(directory, TAU_FILE), tau_y)
+    meta = {
+        "inf": inf,
+        "tau": tau,
+        "min_v": float(min_v),
+        "dv": float(dv),
+        "points": n,
+        "celsius": None if celsius is None else celsius.tolist(),
+        "q10": q10,
+        "base_celsius": base_celsius,
+    }
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=1)
+
+    return load_table(directory)
+
+
+def build_rate_table(directory:str, alpha:str, beta:str, **kwargs) -> GatingTable:
+    """
+    build_table for the inf/tau equations of an alpha/beta pair
+    """
+    inf, tau = ab2inf_tau(alpha, beta, simplify=False)
+    return build_table(directory, inf, tau, **kwargs)
+
+
+def load_table(directory:str, mmap_mode:str="r") -> GatingTable:
+    """
+    Loads a table written by build_table, memory-mapped by default
+    """
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    inf = np.load(os.path.join(directory, INF_FILE), mmap_mode=mmap_mode)
+    tau = np.load(os.path.join(directory, TAU_FILE), mmap_mode=mmap_mode)
+    return GatingTable(inf, tau, meta["min_v"], meta["dv"], meta["celsius"], meta["q10"], meta["base_celsius"])
@@ -0,0 +1,55 @@
+"""
+Temperature (Q10) sweeps
+
+alpha and beta are evaluated once over the voltage grid and scaled by
+q10^((celsius - base_celsius)/10) for every temperature in one broadcast
+pass, giving (temperature x voltage) inf and tau surfaces.
+"""
+
+import numpy as np
+
+from .expressions import compile_expression
+from .fitting import fit_inf_batch
+from .sampling import evaluate_limit
+
+DEFAULT_Q10 = 3.0
+DEFAULT_BASE_CELSIUS = 6.3
+
+
+def q10_factor(celsius, q10:float=DEFAULT_Q10, base_celsius:float=DEFAULT_BASE_CELSIUS):
+    """
+    Rate scaling factor q10^((celsius - base_celsius)/10)
+    """
+    return q10**((np.asarray(celsius, dtype=float) - base_celsius)/10.0)
+
+
+def q10_sweep(alpha:str, beta:str, v, celsius, q10=DEFAULT_Q10, base_celsius:float=DEFAULT_BASE_CELSIUS, fit:bool=False) -> dict:
+    """
+    Evaluates inf and tau over a (len(celsius) x len(v)) grid.
+    q10 is applied to both rates, or pass (q10_alpha, q10_beta) to scale
+    them separately (inf only changes with temperature in that case).
+    With fit=True every inf row is also fit to the Boltzmann form with
+    fit_inf_batch and its (vh, tau) parameters and residuals are returned
+    """
+    v = np.asarray(v, dtype=float)
+    celsius = np.atleast_1d(np.asarray(celsius, dtype=float))
+    q10_alpha, q10_beta = (q10, q10) if np.isscalar(q10) else q10
+
+    rates = evaluate_limit(lambda x: np.vstack([compile_expression(alpha)(x), compile_expression(beta)(x)]), v)
+    a = q10_factor(celsius, q10_alpha, base_celsius)[:, None]*rates[0][None, :]
+    b = q10_factor(celsius, q10_beta, base_celsius)[:, None]*rates[1][None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = a + b
+        result = {
+            "v": v,
+            "celsius": celsius,
+            "inf": a/total,
+            "tau": 1.0/total,
+        }
+
+    if fit:
+        popt, resid = fit_inf_batch(result["inf"], v)
+        result["fit_vh"] = popt[:, 0]
+        result["fit_tau"] = popt[:, 1]
+        result["resid"] = resid
+    return result
@@ -1,49 +1,170 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.optimize import curve_fit
-import sympy
 
-def ab2inf_tau(alpha:str, beta:str, simplify:bool=True) -> tuple:
+from . import cache
+from .expressions import compile_expression, normalize, inf_expression as _inf_expression, tau_expression as _tau_expression
+from .fitting import fit_inf_popt, fit_tau_batch
+from .sampling import adaptive_grid, evaluate_limit
+
+class _Incomplete(Exception):
+    """
+    Carries a simplification cut short by the timeout out of the
+    lru_cache, which doesn't keep results that raise
+    """
+
+
+@lru_cache(maxsize=1024)
+def _simplify_complete(expression:str, timeout:float=None) -> str:
+    key = cache.make_key("simplify", expression)
+    result = cache.get(key)
+    if result is None:
+        from .symbolic import simplify
+        result, strategy, complete = simplify(expression, timeout=timeout, full_output=True)
+        # Results cut short by the timeout aren't kept, a later call may finish
+        if not complete:
+            raise _Incomplete(result)
+        cache.put(key, result)
+    return result
+
+def _simplify(expression:str, timeout:float=None) -> str:
+    try:
+        return _simplify_complete(expression, timeout)
+    except _Incomplete as e:
+        return e.args[0]
+
+def ab2inf_tau(alpha:str, beta:str, simplify:bool=True, timeout:float=None) -> tuple:
     """
     Takes the alpha and beta equations and returns
-    the (inf, tau) symbolic equations
+    the (inf, tau) symbolic equations.
+    Simplification of each is limited to timeout seconds
+    (symbolic.DEFAULT_TIMEOUT by default)
     """
 
-    inf_expression = alpha + "/( " + alpha + " + " + beta + ")"
-    tau_expression = "1/( " + alpha + " + " + beta + ")"
+    inf_expression = _inf_expression(alpha, beta)
+    tau_expression = _tau_expression(alpha, beta)
     
     if simplify:
-        return str(sympy.simplify(inf_expression)), str(sympy.simplify(tau_expression))
+        return simplify_expression(inf_expression, timeout), simplify_expression(tau_expression, timeout)
     else:
         return inf_expression, tau_expression
     
     #np.linspace(float(self.min_row.value()),float(self.max_row.value()),2000)
 
 
-def fit_inf(inf_expression:str, min_v=-100, max_v=50) -> str:
+def simplify_expression(expression:str, timeout:float=None) -> str:
     """
-    Convert an "ugly" inf equation to the standard format
+    Normalizes and simplifies one equation within timeout seconds,
+    sharing ab2inf_tau's caches
     """
-    v = np.linspace(float(min_v),float(max_v),2000)
+    return _simplify(normalize(expression), timeout)
 
-    inf_expression_np = inf_expression.replace("exp(","np.exp(")
-    y = eval(inf_expression_np)
 
-    def inf_func(v,vh,tau):
-        return 1.0/(1.0+(np.exp((v+vh)/(tau))))
+def inf_tau(inf:str, tau:str, simplify:bool=True, timeout:float=None) -> tuple:
+    """
+    Normalizes (and simplifies) equations given directly as inf/tau,
+    the same way ab2inf_tau treats the ones it derives
+    """
+    inf, tau = normalize(inf), normalize(tau) if tau else ""
+    if simplify:
+        return _simplify(inf, timeout), _simplify(tau, timeout) if tau else ""
+    return inf, tau
+
 
-    popt_n, pcov_n = curve_fit(inf_func, v, y, bounds=((-1000,-1000),(1000,-0.00001)))
-    popt_p, pcov_p = curve_fit(inf_func, v, y, bounds=((-1000,0.00001),(1000,1000)))
+def _simplify_parallel(expressions:list, processes:int=None) -> list:
+    """
+    _simplify for many expressions, the ones not in the persistent cache
+    spread over symbolic.simplify_many's worker processes
+    """
+    from .symbolic import simplify_many
+    keys = [cache.make_key("simplify", expression) for expression in expressions]
+    results = [cache.get(key) for key in keys]
+    todo = [i for i, result in enumerate(results) if result is None]
+    for i, (result, strategy, complete) in zip(todo, simplify_many([expressions[i] for i in todo], processes=processes)):
+        results[i] = result
+        if complete:
+            cache.put(keys[i], result)
+    return results
 
-    resid_n = np.linalg.norm(y-inf_func(v, *popt_n))
-    resid_p = np.linalg.norm(y-inf_func(v, *popt_p))
 
-    if resid_n <= resid_p:
-        popt = popt_n
+def ab2inf_tau_batch(pairs, simplify:bool=True, processes:int=None) -> list:
+    """
+    Takes a list of (alpha, beta) pairs and returns a list of
+    (inf, tau) equations in the same order. Identical pairs and identical
+    inf/tau expressions (after normalize) are only simplified once, spread
+    over that many sympy worker processes (processes=None uses every core,
+    processes=1 uses the one shared with ab2inf_tau). Each whole expression
+    is the unit of work: rate terms shared between different gates are not
+    factored out
+    """
+    pairs = [(alpha, beta) for alpha, beta in pairs]
+    if not simplify:
+        return [ab2inf_tau(alpha, beta, simplify=False) for alpha, beta in pairs]
+
+    keys = []
+    expressions = {}
+    for alpha, beta in pairs:
+        inf_key = normalize(_inf_expression(alpha, beta))
+        tau_key = normalize(_tau_expression(alpha, beta))
+        expressions.setdefault(inf_key, None)
+        expressions.setdefault(tau_key, None)
+        keys.append((inf_key, tau_key))
+
+    unique = list(expressions)
+    if processes == 1 or len(unique) <= 1:
+        results = [_simplify(expression) for expression in unique]
     else:
-        popt = popt_p
+        results = _simplify_parallel(unique, processes)
+    expressions.update(zip(unique, results))
+
+    return [(expressions[inf_key], expressions[tau_key]) for inf_key, tau_key in keys]
+
+
+def fit_inf(inf_expression:str, min_v=-100, max_v=50, fast:bool=False, fast_tol:float=1e-3, full_output:bool=False, tol:float=None) -> str:
+    """
+    Convert an "ugly" inf equation to the standard format.
+    fast=True estimates the fit in closed form and only refines it
+    when the RMS residual is above fast_tol.
+    tol samples the equation on an adaptive grid instead of 2000 points.
+    full_output=True returns (inf_func_str, popt, resid)
+    """
+    def compute():
+        if tol:
+            v, y = adaptive_grid(compile_expression(inf_expression), min_v, max_v, tol=tol)
+        else:
+            v = np.linspace(float(min_v),float(max_v),2000)
+            y = evaluate_limit(compile_expression(inf_expression), v)
+        popt, resid = fit_inf_popt(v, y, fast=fast, fast_tol=fast_tol)
+        return [float(p) for p in popt], float(resid)
+
+    key = cache.make_key("fit_inf", normalize(inf_expression), float(min_v), float(max_v), fast, fast_tol, tol)
+    popt, resid = cache.cached(key, compute)
+    popt = np.array(popt)
 
     inf_func_vh = round(popt[0],2)
     inf_func_tau = round(popt[1],2)
     inf_func_str = "1.0/(1.0+(exp((v+" + str(inf_func_vh) + ")/("+ str(inf_func_tau)+"))))"
 
-    return inf_func_str
\ No newline at end of file
+    if full_output:
+        return inf_func_str, popt, resid
+    return inf_func_str
+
+
+
+def fit_tau(tau_expressions, min_v=-100, max_v=50, forms=None, criterion:str="aic", jobs:int=1) -> list:
+    """
+    Fits one tau equation (or a list of them) to the standard tau forms
+    (bell, double exponential, constant + gaussian, constant) and keeps the
+    best by AIC or residual. Returns a dict per equation with the fitted
+    "expression", its "form", "params", "resid", "aic" and the scores of
+    every "candidates" form
+    """
+    single = isinstance(tau_expressions, str)
+    if single:
+        tau_expressions = [tau_expressions]
+
+    v = np.linspace(float(min_v),float(max_v),2000)
+    curves = [evaluate_limit(compile_expression(tau), v) for tau in tau_expressions]
+    results = fit_tau_batch(curves, v, forms=forms, criterion=criterion, jobs=jobs)
+
+    return results[0] if single else results
@@ -0,0 +1,51 @@
+"""
+Helpers shared by the headless commands (convert, scan and report)
+
+Work spread over a process pool is run through profiled so each worker's
+stage timings come back with its result, and the indexes that let a run
+skip unchanged inputs are versioned JSON files written atomically.
+"""
+
+import json
+import os
+
+from . import profiling
+
+
+def profiled(func, *args) -> tuple:
+    """
+    Calls func(*args) in a worker process and returns (result, stats) with
+    the stage timings of that call, for the parent to profiling.merge
+    """
+    profiling.reset()
+    return func(*args), profiling.stats()
+
+
+def load_json(path:str, version:int, options:dict, empty:dict) -> dict:
+    """
+    Loads the JSON index at path. A missing or unreadable file (eg cut
+    short by an interrupted run), or one written with another version or
+    options, starts a new index from empty
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    if isinstance(data, dict) and data.get("version") == version and data.get("options") == options:
+        return data
+    return dict(empty, version=version, options=options)
+
+
+def write_text(text:str, path:str):
+    """
+    Replaces the file at path, readers never see it half written
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def save_json(data:dict, path:str):
+    write_text(json.dumps(data, indent=1), path)
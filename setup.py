@@ -22,6 +22,9 @@ setup(
         'scipy',
         'sympy'
     ],
+    extras_require={
+        'numexpr': ['numexpr'],
+    },
     classifiers=[
         'Intended Audience :: Developers',
         'Intended Audience :: Education',